@@ -0,0 +1,158 @@
+"""
+Admission control for expensive commands.
+
+Every heavy command first passes per-user and per-guild token buckets, then
+waits for one of a fixed number of job slots. Waiting commands are served by
+weighted fair queuing across guilds (start-time fair queuing on virtual
+finish tags), so one busy guild can't starve the others. Commands are turned
+away up front, with a message the user can act on, when they are over their
+rate or the queue is already too deep.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class AdmissionError(RuntimeError):
+    """Raised when a command is not admitted; the message is meant for the user."""
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst):
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def refill(self, rate, burst, now):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+
+class Ticket:
+    """An admitted command. `async with ticket:` waits for a job slot and holds it."""
+    __slots__ = ("controller", "queue_key", "kind", "cost", "started")
+
+    def __init__(self, controller, queue_key, kind, cost):
+        self.controller = controller
+        self.queue_key = queue_key
+        self.kind = kind
+        self.cost = cost
+        self.started = None
+
+    @property
+    def must_wait(self):
+        return self.controller.running >= self.controller.max_concurrent or self.controller.waiting > 0
+
+    async def __aenter__(self):
+        queued_at = time.perf_counter()
+        await self.controller._acquire(self.queue_key, self.cost)
+        self.started = time.perf_counter()
+        if self.controller.metrics is not None:
+            self.controller.metrics.observe("admission_wait_seconds", self.started - queued_at, self.kind)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.controller._release()
+
+
+class AdmissionController:
+    """Rate limits, a global cap on concurrent heavy jobs and fair queuing across guilds."""
+
+    # Buckets refill continuously; burst is how many commands can be sent back to back
+    USER_BURST = 4
+    GUILD_BURST = 20
+    # Idle (full) buckets are dropped once there are this many
+    MAX_BUCKETS = 10000
+
+    def __init__(self, max_concurrent=4, max_queue=32, user_per_minute=12, guild_per_minute=60, weights=None, metrics=None):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.user_rate = user_per_minute / 60
+        self.guild_rate = guild_per_minute / 60
+        # Share of the job slots per guild ID relative to the default of 1
+        self.weights = weights or {}
+        self.metrics = metrics
+        self.running = 0
+        self.waiting = 0
+        self.rejected = {"user_rate": 0, "guild_rate": 0, "queue_full": 0}
+        self._users = {}
+        self._guilds = {}
+        self._queue = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish = {}
+        if metrics is not None:
+            metrics.histogram("admission_wait_seconds", "Time heavy commands waited for a job slot.", "command")
+
+    def _bucket(self, buckets, key, rate, burst, now):
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= self.MAX_BUCKETS:
+                for idle in [k for k, b in buckets.items() if b.tokens + (now - b.updated) * rate >= burst]:
+                    del buckets[idle]
+            bucket = buckets[key] = TokenBucket(burst)
+        bucket.refill(rate, burst, now)
+        return bucket
+
+    def admit(self, user_id, guild_id, kind, cost=1.0) -> Ticket:
+        """Charge the user's and guild's buckets and return a ticket, or raise AdmissionError."""
+        now = time.monotonic()
+        user = self._bucket(self._users, user_id, self.user_rate, self.USER_BURST, now)
+        guild = self._bucket(self._guilds, guild_id, self.guild_rate, self.GUILD_BURST, now) if guild_id else None
+        if user.tokens < 1:
+            self.rejected["user_rate"] += 1
+            wait = (1 - user.tokens) / self.user_rate
+            raise AdmissionError(f"You're sending commands too quickly, please try again in {wait:.0f} seconds.")
+        if guild is not None and guild.tokens < 1:
+            self.rejected["guild_rate"] += 1
+            wait = (1 - guild.tokens) / self.guild_rate
+            raise AdmissionError(f"This server is using the bot heavily right now, please try again in {wait:.0f} seconds.")
+        if self.waiting >= self.max_queue:
+            # Shed load before anyone is charged for it
+            self.rejected["queue_full"] += 1
+            raise AdmissionError("The bot is busy right now, please try again in a moment.")
+        user.tokens -= 1
+        if guild is not None:
+            guild.tokens -= 1
+        # Direct messages queue as their own "guild" per user
+        return Ticket(self, guild_id or f"user:{user_id}", kind, cost)
+
+    async def _acquire(self, queue_key, cost):
+        if self.running < self.max_concurrent and not self.waiting:
+            self.running += 1
+            return
+        # The guild's next finish tag continues from its own backlog, or from now if it had none
+        finish = max(self._virtual_time, self._last_finish.get(queue_key, 0.0)) + cost / self.weights.get(queue_key, 1.0)
+        self._last_finish[queue_key] = finish
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (finish, next(self._sequence), future))
+        self.waiting += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the command was cancelled
+                self._release()
+            else:
+                self.waiting -= 1
+            raise
+
+    def _release(self):
+        while self._queue:
+            finish, _, future = heapq.heappop(self._queue)
+            if future.done():
+                # Cancelled while waiting, already taken off the count
+                continue
+            self.waiting -= 1
+            self._virtual_time = finish
+            # The slot passes straight to the next command, running stays the same
+            future.set_result(None)
+            return
+        self.running -= 1
+        # With nobody waiting every guild starts level again
+        self._last_finish.clear()
+
+    def stats(self):
+        return {"running": self.running, "waiting": self.waiting, **{f"rejected_{reason}": count for reason, count in self.rejected.items()}}
@@ -0,0 +1,141 @@
+"""
+Batch rendering: many equations typeset in a single pdflatex run.
+
+Each equation goes on its own page of one document. The pages are
+rasterized together, cropped to their content and either returned one by one
+or stacked into a single composite image.
+"""
+import os
+import re
+import subprocess
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from pdf2image import convert_from_bytes
+
+from render_io import scratch_dir
+
+MAX_BATCH = 20
+
+BATCH_PREAMBLE = [
+    r"\documentclass[12pt]{article}",
+    r"\usepackage{amsmath}",
+    r"\usepackage{amssymb}",
+    r"\pagestyle{empty}",
+    r"\begin{document}",
+]
+
+# With -file-line-error pdflatex reports errors as "./batch.tex:12: message"
+_LOG_ERROR = re.compile(r"^\./batch\.tex:(\d+): (.*)$", re.MULTILINE)
+
+
+class BatchMismatchError(RuntimeError):
+    """Raised when the compiled document doesn't have one page per equation."""
+
+
+def build_batch_source(equations):
+    """Return the document source and the (first, last) source line of each equation."""
+    lines = list(BATCH_PREAMBLE)
+    spans = []
+    for equation in equations:
+        # \mbox{} guarantees every page has content, even for an empty equation
+        lines.append(r"\noindent\mbox{}\[")
+        first = len(lines) + 1
+        lines.extend(equation.splitlines() or [""])
+        spans.append((first, len(lines)))
+        lines.append(r"\]")
+        lines.append(r"\clearpage")
+    lines.append(r"\end{document}")
+    return "\n".join(lines) + "\n", spans
+
+
+def crop_to_content(image, padding=24):
+    """Trim the white page around the ink, keeping a small border."""
+    bbox = ImageOps.invert(image.convert("L")).getbbox()
+    if bbox is None:
+        return None
+    left, top, right, bottom = bbox
+    return image.crop((
+        max(left - padding, 0),
+        max(top - padding, 0),
+        min(right + padding, image.width),
+        min(bottom + padding, image.height),
+    ))
+
+
+def stack_images(images, gap=16):
+    """Stack images vertically into one composite, centred on a white background."""
+    width = max(image.width for image in images)
+    height = sum(image.height for image in images) + gap * (len(images) - 1)
+    composite = Image.new("RGB", (width, height), "white")
+    y = 0
+    for image in images:
+        composite.paste(image, ((width - image.width) // 2, y))
+        y += image.height + gap
+    return composite
+
+
+def compile_batch(equations, dpi=200, timeout=60):
+    """Typeset every equation in one pdflatex run.
+
+    Returns a list with a (PIL image or None, error message or None) pair per
+    equation. Raises BatchMismatchError if the pages can't be matched back to
+    the equations, in which case the caller should render them one at a time.
+    """
+    source, spans = build_batch_source(equations)
+    with scratch_dir() as workdir:
+        with open(os.path.join(workdir, "batch.tex"), "w", encoding="utf-8") as f:
+            f.write(source)
+        try:
+            subprocess.run(
+                ["pdflatex", "-interaction=nonstopmode", "-file-line-error", "batch.tex"],
+                cwd=workdir,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=timeout,
+                check=False,
+            )
+        except subprocess.TimeoutExpired as e:
+            raise RuntimeError("LaTeX Error: compilation timed out") from e
+
+        try:
+            with open(os.path.join(workdir, "batch.pdf"), "rb") as f:
+                pdf = f.read()
+        except OSError as e:
+            raise BatchMismatchError("no PDF was produced") from e
+        with open(os.path.join(workdir, "batch.log"), "r", encoding="utf-8", errors="replace") as f:
+            log = f.read()
+
+    errors = {}
+    for match in _LOG_ERROR.finditer(log):
+        line = int(match.group(1))
+        for index, (first, last) in enumerate(spans):
+            # Errors are often reported on the closing \] just after the equation
+            if first <= line <= last + 1:
+                errors.setdefault(index, match.group(2).strip())
+                break
+
+    pages = convert_from_bytes(pdf, dpi=dpi, grayscale=True)
+    if len(pages) != len(equations):
+        raise BatchMismatchError(f"expected {len(equations)} pages, got {len(pages)}")
+
+    results = []
+    for index, page in enumerate(pages):
+        if index in errors:
+            results.append((None, errors[index]))
+            continue
+        cropped = crop_to_content(page)
+        if cropped is None:
+            results.append((None, "The equation rendered as an empty image."))
+        else:
+            results.append((cropped, None))
+    return results
+
+
+def open_png(png: bytes):
+    """Decode PNG bytes into a PIL image (used to stack cached renders)."""
+    image = Image.open(BytesIO(png))
+    image.load()
+    return image.convert("RGB")
+
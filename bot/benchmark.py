@@ -0,0 +1,358 @@
+"""
+Offline micro-benchmarks for the rendering and math paths.
+
+Every benchmark runs in its own process so its peak RSS is its own, against a
+corpus built from questions.json, qotd.json and a set of hard LaTeX cases.
+Results (p50/p95/p99 latency, peak RSS, output image size) are written as
+JSON; pass an earlier results file with --compare to flag regressions.
+
+Run from the repository root:
+
+    python bot/benchmark.py
+    python bot/benchmark.py --only plot_function --repeat 10
+    python bot/benchmark.py --compare bot/tmp/benchmark-baseline.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+# LaTeX that exercises the slow parts of TeX (alignment, big operators, matrices)
+HARD_LATEX = [
+    r"\int_{-\infty}^{\infty} e^{-x^2}\,dx = \sqrt{\pi}",
+    r"\sum_{n=1}^{\infty} \frac{1}{n^2} = \frac{\pi^2}{6}",
+    r"\begin{pmatrix} a & b & c \\ d & e & f \\ g & h & i \end{pmatrix}^{-1}",
+    r"\begin{aligned} f(x) &= (x+1)^2 \\ &= x^2 + 2x + 1 \end{aligned}",
+    r"f(x) = \begin{cases} x^2 & x \ge 0 \\ -x & x < 0 \end{cases}",
+    r"\lim_{x \to 0} \frac{\sin x}{x} = 1",
+    r"\frac{\partial^2 u}{\partial t^2} = c^2 \nabla^2 u",
+    r"\sqrt[3]{\frac{a^3 + b^3}{\left(a + b\right)^{2}}}",
+    r"\oint_{\partial \Sigma} \mathbf{B} \cdot d\mathbf{l} = \mu_0 \iint_{\Sigma} \mathbf{J} \cdot d\mathbf{S}",
+    r"\left\lfloor \frac{n}{2} \right\rfloor + \binom{n}{k} \pmod{p}",
+]
+
+# AI answers as format_to_latex receives them
+AI_ANSWERS = [
+    r"\(\frac{x^2+1}{2x}\)",
+    r"$3x^2 + 2x - 5$",
+    r"\frac{1}{x} + 4x",
+    r"2\sin(3x) + x^2",
+]
+
+PLOT_FUNCTIONS = ["x**2", "sin(x)/x", "tan(x)", "1/(x-0.3)", "floor(x)", "exp(-x**2)*cos(5*x)"]
+
+SHAPES = [
+    ("triangle", 3, 4, 5),
+    ("circle", 2, None, None),
+    ("rectangle", 4, 2, None),
+    ("square", 3, None, None),
+]
+
+
+def load_corpus():
+    """Inputs for every benchmark, built from the bot's own question banks."""
+    from question_store import QuestionStore
+    import mathops
+
+    store = QuestionStore()
+    qotd = [store.qotd(date)["question"] for date in store.past_qotd_dates(limit=1000)]
+    quiz = [entry for topic in store.topics() for entry in store.quiz_questions(topic)]
+
+    equations = qotd + HARD_LATEX + [f"\\text{{{entry['question']}}}" for entry in quiz[:10]]
+
+    # Plain-text answers to the quiz that sympy can parse become the math corpus
+    format_to_latex = _bot().format_to_latex
+    expressions = []
+    for entry in quiz:
+        for option in entry["options"].values():
+            try:
+                expressions.append(mathops.parse_expression(format_to_latex(option)))
+            except Exception:
+                continue
+    return {
+        "equations": equations,
+        "ai_answers": AI_ANSWERS + [entry["question"] for entry in quiz],
+        "expressions": expressions,
+        "plot_functions": PLOT_FUNCTIONS,
+        "shapes": SHAPES,
+    }
+
+
+def _bot():
+    # The bot module reads its settings at import time
+    os.environ.setdefault("GUILD_ID", "0")
+    os.environ.setdefault("AI_BACKEND", "stub")
+    import bot
+    return bot
+
+
+def _png_size(result):
+    if isinstance(result, tuple):
+        result = result[0]
+    return len(result) if isinstance(result, (bytes, bytearray)) else None
+
+
+def _visualize_uncached(bot):
+    # visualize_equation reuses compiled PDFs, which would hide the compile after one pass
+    def visualize(equation):
+        return bot.encode_image(bot.rasterize_pdf(bot.compile_equation(equation), dpi=bot.OUTPUT_DPI))
+    return visualize
+
+
+def bench_visualize_cold(corpus):
+    bot = _bot()
+    return _visualize_uncached(bot), [(eq,) for eq in corpus["equations"]]
+
+
+def bench_visualize_warm(corpus):
+    bot = _bot()
+    if not bot.tex_pool.start():
+        raise RuntimeError("the warm TeX pool could not be started")
+    return _visualize_uncached(bot), [(eq,) for eq in corpus["equations"]]
+
+
+def bench_render_mathtext(corpus):
+    from mathtext_render import can_use_mathtext, render_mathtext
+    return render_mathtext, [(eq,) for eq in corpus["equations"] if can_use_mathtext(eq)]
+
+
+def bench_check_latex(corpus):
+    from latex_check import check_latex
+    return check_latex, [(eq,) for eq in corpus["equations"]]
+
+
+def bench_encode_image(corpus):
+    from mathtext_render import can_use_mathtext, render_mathtext
+    from batch_render import open_png
+    from render_io import FORMATS, THEMES, encode_image
+    images = [open_png(render_mathtext(eq)) for eq in corpus["equations"] if can_use_mathtext(eq)]
+    return encode_image, [(image, fmt, theme) for image in images for fmt in FORMATS for theme in THEMES]
+
+
+def bench_plot_function(corpus):
+    bot = _bot()
+    return bot.plot_function, [([expression],) for expression in corpus["plot_functions"]]
+
+
+def bench_format_to_latex(corpus):
+    bot = _bot()
+    return bot.format_to_latex, [(answer,) for answer in corpus["ai_answers"]]
+
+
+def bench_sympy_to_latex(corpus):
+    bot = _bot()
+    return bot.sympy_to_latex, [(expr,) for expr in corpus["expressions"]]
+
+
+def bench_draw_shape(corpus):
+    bot = _bot()
+    import geometry
+
+    # draw_shape serves repeated shapes from the render cache, which would hide the drawing
+    def draw(shape, side1, side2, side3):
+        return bot.render_shape(geometry.canonicalize(shape, side1, side2, side3))
+    return draw, corpus["shapes"]
+
+
+def bench_draw_shape_cached(corpus):
+    bot = _bot()
+    return bot.draw_shape, corpus["shapes"]
+
+
+# name: (setup, needs pdflatex)
+BENCHMARKS = {
+    "visualize_equation_cold": (bench_visualize_cold, True),
+    "visualize_equation_warm": (bench_visualize_warm, True),
+    "render_mathtext": (bench_render_mathtext, False),
+    "check_latex": (bench_check_latex, False),
+    "encode_image": (bench_encode_image, False),
+    "plot_function": (bench_plot_function, False),
+    "format_to_latex": (bench_format_to_latex, False),
+    "sympy_to_latex": (bench_sympy_to_latex, False),
+    "draw_shape": (bench_draw_shape, False),
+    "draw_shape_cached": (bench_draw_shape_cached, False),
+}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an unsorted list."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _peak_rss_mb(who):
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(name, repeat):
+    """Run one benchmark in this process and return its summary."""
+    setup, _ = BENCHMARKS[name]
+    fn, cases = setup(load_corpus())
+    if not cases:
+        raise RuntimeError("the corpus has no inputs for this benchmark")
+
+    # The first call pays for imports and caches the bot would warm up once
+    start = time.perf_counter()
+    fn(*cases[0])
+    first_call_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    sizes = []
+    errors = 0
+    for _ in range(repeat):
+        for args in cases:
+            start = time.perf_counter()
+            try:
+                result = fn(*args)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            size = _png_size(result)
+            if size is not None:
+                sizes.append(size)
+    if not latencies:
+        raise RuntimeError("every call failed")
+
+    return {
+        "calls": len(latencies),
+        "errors": errors,
+        "first_call_ms": round(first_call_ms, 3),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        "children_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+        "image_bytes_mean": round(sum(sizes) / len(sizes)) if sizes else None,
+        "image_bytes_max": max(sizes) if sizes else None,
+    }
+
+
+def run_isolated(name, repeat):
+    """Run one benchmark in a fresh interpreter so peak RSS is not shared."""
+    with tempfile.TemporaryDirectory() as workdir:
+        result_path = os.path.join(workdir, "result.json")
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", name,
+             "--repeat", str(repeat), "--output", result_path],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=False,
+        )
+        if process.returncode != 0 or not os.path.exists(result_path):
+            lines = process.stderr.strip().splitlines()
+            return {"skipped": lines[-1] if lines else f"exit code {process.returncode}"}
+        with open(result_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Print the change against a baseline; return the names that got slower or bigger."""
+    regressions = []
+    print(f"{'benchmark':<26}{'metric':<13}{'before':>11}{'after':>11}{'change':>9}")
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before or "skipped" in before or "skipped" in result:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "peak_rss_mb"):
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            flag = ""
+            # Sub-millisecond timings are mostly noise, so they also need an absolute slowdown
+            if change > threshold and (metric == "peak_rss_mb" or new - old >= min_delta_ms):
+                flag = "  regressed"
+                regressions.append(name)
+            print(f"{name:<26}{metric:<13}{old:>11.2f}{new:>11.2f}{change:>+9.0%}{flag}")
+    return sorted(set(regressions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the corpus")
+    parser.add_argument("--output", default="bot/tmp/benchmark.json", help="where to write the results")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown that counts as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="smallest absolute slowdown that counts")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # bot/ has to be importable however the script was started
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    if args.child:
+        result = run_benchmark(args.child, args.repeat)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0
+
+    has_pdflatex = shutil.which("pdflatex") is not None
+    results = {}
+    for name in args.only or BENCHMARKS:
+        if BENCHMARKS[name][1] and not has_pdflatex:
+            results[name] = {"skipped": "pdflatex is not installed"}
+        else:
+            results[name] = run_isolated(name, args.repeat)
+        result = results[name]
+        if "skipped" in result:
+            print(f"{name}: skipped ({result['skipped']})")
+        else:
+            print(f"{name}: p50 {result['p50_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms, "
+                  f"p99 {result['p99_ms']:.2f} ms, peak RSS {result['peak_rss_mb'] or 0:.0f} MB")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "pdflatex": has_pdflatex,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,21 +4,16 @@ from discord.ext import tasks
 from dotenv import load_dotenv
 import os
 import time
+import datetime
 import subprocess
-from pylatex import Document, Math, NoEscape
-from pdf2image import convert_from_path
-import sympy as sp
-import matplotlib.pyplot as plt
-import numpy as np
-from scipy.stats import linregress
-from io import BytesIO
+import functools
+import hashlib
 import json
+from io import BytesIO
 import random
 import asyncio
 import re
-
-# AI
-import google.generativeai as genai
+from collections import Counter
 
 # Status
 import cronitor
@@ -26,12 +21,46 @@ import cronitor
 # Text stuff
 from text import HELP_TEXT
 
+# Rendering
+from render_cache import RenderCache, make_key, normalize_equation
+from tex_pool import TexWorkerPool
+from render_io import FORMATS, THEMES, scratch_dir, rasterize_pdf, encode_image
+from figures import FigurePool
+from translator import Translator, GeminiBackend, StubBackend
+from singleflight import SingleFlight
+from question_store import QuestionStore, format_date
+from batch_render import MAX_BATCH, BatchMismatchError, compile_batch, stack_images, open_png
+from executor import JobExecutor
+from render_service import NoWorkerError, WorkerClient
+from metrics import Metrics, sample_loop_lag, start_http_server
+from inline_math import AutoRenderer, find_segments
+from admission import AdmissionController, AdmissionError
+from latex_check import LatexError, check_latex
+from sessions import SessionStore, QuizSession, TableSession, DatasetSession, FollowUps
+import mathops
+import geometry
+from lazy import lazy_import, preload
+
+# sympy, numpy and matplotlib are imported on first use, or by warm_imports() once the bot is ready
+sp = lazy_import("sympy")
+np = lazy_import("numpy")
+mathtext_render = lazy_import("mathtext_render")
+plotting = lazy_import("plotting")
+datasets = lazy_import("datasets")
+regression = lazy_import("regression")
+
+# Startup time is reported in on_ready
+STARTED_AT = time.perf_counter()
+
 # Load environment variables
 load_dotenv()
 TOKEN = os.getenv("TOKEN")
 GUILD_ID = os.getenv("GUILD_ID")
 GOOGLE_API_KEY=os.getenv('GOOGLE_API_KEY')
 CRONITOR_API_KEY = os.getenv("CRONITOR_API_KEY")
+# Prometheus-style metrics endpoint; METRICS_PORT=0 turns it off
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
 
 MONITOR_NAME = "discord-latex-bot"
 cronitor.api_key = CRONITOR_API_KEY
@@ -40,12 +69,148 @@ monitor = cronitor.Monitor(MONITOR_NAME)
 MY_GUILD = discord.Object(id=GUILD_ID)  # Replace with your guild ID
 
 # AI Config
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel("gemini-1.0-pro")
 prompt = "Provide just the LaTeX function for the following equation/expression, even if it is incorrect, follow strict LaTeX formatting"
 
-with open('bot/questions.json', 'r') as f:
-    questions = json.load(f)
+# Per-stage and per-command timings, served on /metrics and sent to Cronitor
+metrics = Metrics()
+
+# AI_BACKEND=stub swaps Gemini for a local stand-in that echoes its input
+if os.getenv("AI_BACKEND", "gemini") == "stub":
+    ai_backend = StubBackend()
+else:
+    ai_backend = GeminiBackend("gemini-1.0-pro", prompt, api_key=GOOGLE_API_KEY)
+translator = Translator(
+    ai_backend,
+    ttl=float(os.getenv("AI_CACHE_TTL", str(24 * 60 * 60))),
+    max_concurrency=int(os.getenv("AI_MAX_CONCURRENCY", "4")),
+    timeout=float(os.getenv("AI_TIMEOUT", "20")),
+    metrics=metrics,
+)
+
+# Everything that changes the compiled PDF has to be part of the cache key
+RENDER_SETTINGS = {
+    "version": 4,
+    "documentclass": "standalone",
+    "font_size": "12pt",
+    "border": "4pt",
+    "packages": ["amsmath", "amssymb"],
+}
+# Default output; /render can pick another size, format or theme per request
+OUTPUT_DPI = int(os.getenv("RENDER_DPI", "200"))
+OUTPUT_FORMAT = os.getenv("RENDER_FORMAT", "png")
+OUTPUT_THEME = os.getenv("RENDER_THEME", "light")
+render_cache = RenderCache(
+    max_items=int(os.getenv("RENDER_CACHE_ITEMS", "256")),
+    max_disk_bytes=int(os.getenv("RENDER_CACHE_DISK_MB", "64")) * 1024 * 1024,
+)
+# Shape images share the render cache, keyed by the canonical shape
+SHAPE_SETTINGS = {"version": 1, "engine": "shape", "figsize": [6.4, 4.8]}
+# So do function plots, keyed by the normalized functions and the x range
+PLOT_SETTINGS = {"version": 1, "engine": "plot", "figsize": [8, 6]}
+# Simple equations skip TeX entirely and are drawn with matplotlib's mathtext
+MATHTEXT_FAST_PATH = os.getenv("MATHTEXT_FAST_PATH", "1") == "1"
+# How many fresh renders went through each engine
+render_engine_counts = Counter()
+# Equations are checked before any render starts; these are the limits and the rejections by reason
+MAX_LATEX_LENGTH = int(os.getenv("MAX_LATEX_LENGTH", "4000"))
+MAX_LATEX_NESTING = int(os.getenv("MAX_LATEX_NESTING", "32"))
+rejected_equations = Counter()
+
+# Warm pdflatex processes with the preamble precompiled, started in setup_hook
+tex_pool = TexWorkerPool(size=int(os.getenv("TEX_POOL_SIZE", "2")))
+
+# Worker threads for TeX, sympy sandboxes and matplotlib so handlers never block the gateway
+executor = JobExecutor(
+    io_workers=int(os.getenv("IO_WORKERS", "4")),
+    max_pending=int(os.getenv("MAX_PENDING_JOBS", "32")),
+    timeout=float(os.getenv("JOB_TIMEOUT", "60")),
+)
+
+# Each symbolic operation runs in its own killable, resource-limited process
+symbolic_engine = mathops.SymbolicEngine(
+    timeout=float(os.getenv("MATH_TIMEOUT", "10")),
+    memory_mb=int(os.getenv("MATH_MEMORY_MB", "512")),
+)
+
+# Per-user and per-guild rate limits and a fair share of job slots for heavy commands.
+# ADMISSION_GUILD_WEIGHTS gives guilds a bigger share, e.g. "1234:2,5678:0.5".
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("MAX_HEAVY_JOBS", "4")),
+    max_queue=int(os.getenv("MAX_QUEUED_COMMANDS", "32")),
+    user_per_minute=float(os.getenv("USER_COMMANDS_PER_MINUTE", "12")),
+    guild_per_minute=float(os.getenv("GUILD_COMMANDS_PER_MINUTE", "60")),
+    weights={
+        int(guild): float(weight)
+        for guild, weight in (item.split(":") for item in os.getenv("ADMISSION_GUILD_WEIGHTS", "").split(",") if item)
+    },
+    metrics=metrics,
+)
+
+# Identical renders and plots requested at the same time share one job
+render_flight = SingleFlight()
+
+# Render workers (bot/render_worker.py) listening on Unix sockets in this directory.
+# Unset runs every job in this process; jobs also stay here while no worker is healthy.
+RENDER_WORKERS_DIR = os.getenv("RENDER_WORKERS_DIR", "")
+render_workers = None
+if RENDER_WORKERS_DIR:
+    render_workers = WorkerClient(
+        RENDER_WORKERS_DIR,
+        timeout=float(os.getenv("JOB_TIMEOUT", "60")),
+        retries=int(os.getenv("WORKER_RETRIES", "2")),
+        error_types=lambda: (mathops.ComputationTimeout, sp.SympifyError, ValueError, RuntimeError),
+    )
+
+# Reusable Agg figures, safe to draw on from several worker threads at once
+figure_pool = FigurePool(size=int(os.getenv("FIGURE_POOL_SIZE", "4")))
+
+# Quiz and QOTD banks, reloaded automatically when the JSON files change
+question_store = QuestionStore()
+
+# QOTD images rendered ahead of time, by date: (question text, PNG bytes)
+qotd_images = {}
+QOTD_PRERENDER_DAYS = int(os.getenv("QOTD_PRERENDER_DAYS", "3"))
+
+# Quiz and input table state, by message ID, saved to disk so buttons keep working across restarts
+sessions = SessionStore(
+    ttl=float(os.getenv("SESSION_TTL", "3600")),
+    max_sessions=int(os.getenv("MAX_SESSIONS", "10000")),
+    max_bytes=int(os.getenv("SESSION_MEMORY_MB", "64")) * 1024 * 1024,
+)
+follow_ups = FollowUps()
+# Fit and residual plots of recent datasets, so flipping between them doesn't redraw
+fit_images = RenderCache(max_items=64, disk_dir="")
+# Seconds a quiz answer is shown before the next question
+QUIZ_RESULT_SECONDS = 3
+
+# Inline $...$ math in channels that turned it on with /auto_render.
+# Reading messages needs the privileged message content intent, so it is off unless AUTO_RENDER=1.
+AUTO_RENDER = os.getenv("AUTO_RENDER", "0") == "1"
+
+# Hash of the last command tree synced to Discord; syncing is skipped while it matches.
+# FORCE_COMMAND_SYNC=1 syncs anyway, e.g. after the commands were changed by hand.
+COMMAND_TREE_HASH_PATH = "bot/tmp/command_tree.sha256"
+FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC", "0") == "1"
+# Seconds from loading the module to on_ready
+ready_seconds = 0.0
+
+# Gauges are read whenever /metrics is scraped or Cronitor is pinged
+metrics.gauge("startup_seconds", "Seconds from loading the bot to being ready.", lambda: ready_seconds)
+metrics.gauge("loop_lag_last_seconds", "Most recent event loop lag sample.", lambda: metrics.last_loop_lag)
+metrics.gauge("pending_jobs", "Jobs queued or running on the worker pools.", lambda: executor.pending)
+metrics.gauge("rejected_jobs", "Jobs turned away because the queue was full.", lambda: executor.rejected)
+metrics.gauge("timed_out_jobs", "Jobs abandoned after the job timeout.", lambda: executor.timeouts)
+metrics.gauge("render_cache_hit_rate", "Share of renders served from the image cache.", lambda: render_cache.stats()["hit_rate"])
+metrics.gauge("ai_cache_hit_rate", "Share of AI translations served from the cache.", lambda: translator.stats()["hit_rate"])
+metrics.gauge("math_memo_hits", "Symbolic operations answered from the memo.", lambda: symbolic_engine.memo_hits)
+metrics.gauge("deduplicated_jobs", "Render and plot requests that joined an identical job already running.", lambda: render_flight.deduplicated)
+metrics.gauge("render_workers", "Render workers found and how many of them are healthy.", lambda: render_workers.stats() if render_workers else {})
+metrics.gauge("sessions", "Live quiz and input table sessions.", sessions.stats)
+metrics.gauge("session_bytes", "Approximate memory held by sessions, mostly dataset points.", lambda: sessions.nbytes)
+metrics.gauge("scheduled_follow_ups", "Quiz follow-ups waiting for their delay to pass.", lambda: follow_ups.waiting)
+metrics.gauge("admission", "Heavy commands running, waiting for a slot and turned away by reason.", admission.stats)
+metrics.gauge("renders_by_engine", "Fresh renders per engine.", lambda: dict(render_engine_counts))
+metrics.gauge("rejected_equations", "Equations refused before rendering, by reason.", lambda: dict(rejected_equations))
 
 class MetaCalculatorButton(discord.ui.View):
     def __init__(self, expression):
@@ -63,172 +228,251 @@ class MetaCalculatorButton(discord.ui.View):
         # Return the full URL for Meta Calculator with the encoded expression
         return f"https://www.meta-calculator.com/?panel-101-equations&data-bounds-xMin=-8&data-bounds-xMax=8&data-bounds-yMin=-11&data-bounds-yMax=11&data-equations-0=%22{encoded_expression}%22&data-rand=undefined&data-hideGrid=false"
 
-class InputModal(discord.ui.Modal):
-    def __init__(self, button, view):
-        super().__init__(title="Enter Value")
-        self.button = button
-        self.view = view
+class BatchRenderModal(discord.ui.Modal):
+    def __init__(self, layout):
+        super().__init__(title="Render Equations")
+        self.layout = layout
+        # Slash command options are single line, so the equations are collected here
+        self.equations_input = discord.ui.TextInput(
+            label="Equations (one per line)",
+            style=discord.TextStyle.paragraph,
+            max_length=4000,
+        )
+        self.add_item(self.equations_input)
+
+    async def on_submit(self, interaction: discord.Interaction):
+        await send_batch(interaction, split_equations(self.equations_input.value), self.layout)
+
+def components(*items):
+    """A view that only lays out buttons; their clicks are routed by custom_id in on_interaction."""
+    view = discord.ui.View(timeout=None)
+    for item in items:
+        view.add_item(item)
+    # A finished view isn't kept in discord.py's view store
+    view.stop()
+    return view
+
+def table_components(session):
+    buttons = []
+    for index, value in enumerate(session.values):
+        row, column = divmod(index, 2)
+        label = f"Input {row}, {'XY'[column]}" if value is None else f"{value:g}"
+        buttons.append(discord.ui.Button(label=label, style=discord.ButtonStyle.primary, custom_id=f"table:cell:{index}", disabled=value is not None))
+    # The last action row; the cells of a full 12 row table leave exactly one slot there
+    buttons.append(discord.ui.Button(label="Submit Table", style=discord.ButtonStyle.success, custom_id="table:submit", row=4))
+    return components(*buttons)
+
+def quiz_components(session, chosen=None):
+    """Buttons for the current question; once chosen, they are disabled and the choice is colored."""
+    question = session.current_question
+    buttons = []
+    for option_key, value in question['options'].items():
+        style = discord.ButtonStyle.secondary
+        if option_key == chosen:
+            style = discord.ButtonStyle.success if option_key == question['answer'] else discord.ButtonStyle.danger
+        buttons.append(discord.ui.Button(label=f"{option_key.upper()}: {value}", style=style, custom_id=f"quiz:{option_key}", disabled=chosen is not None))
+    return components(*buttons)
+
+class TableValueModal(discord.ui.Modal):
+    def __init__(self, message_id, index):
+        # Modals wait in discord.py's view store, so abandoned ones must time out
+        super().__init__(title="Enter Value", timeout=600)
+        self.message_id = message_id
+        self.index = index
         # Add a text input field to the modal
         self.value_input = discord.ui.TextInput(label="Enter a number", style=discord.TextStyle.short)
         self.add_item(self.value_input)
 
     async def on_submit(self, interaction: discord.Interaction):
-        # Update the button label with the entered value
-        self.button.label = self.value_input.value
-        self.button.disabled = True  # Optionally disable the button after input
-        # Update the message with the new view state
-        await interaction.response.edit_message(view=self.view)
-
-class TableButton(discord.ui.Button):
-    def __init__(self, row, col, label):
-        # Initialize with dynamic labels indicating their purpose
-        super().__init__(label=label, style=discord.ButtonStyle.primary)
-        self.row = row
-        self.col = col
-
-    async def callback(self, interaction: discord.Interaction):
-        # The modal can capture the input value
-        modal = InputModal(button=self, view=self.view)
-        await interaction.response.send_modal(modal)
-
-class TableInputView(discord.ui.View):
-    def __init__(self, rows):
-        super().__init__()
-        # Initialize buttons in a grid format based on the number of rows
-        for i in range(rows):
-            # Add a button for X value in column 0
-            self.add_item(TableButton(row=i, col=0, label=f"Input {i}, X"))
-            # Add a button for Y value in column 1
-            self.add_item(TableButton(row=i, col=1, label=f"Input {i}, Y"))
-        # Add a submit button at the end
-        self.add_item(SubmitButton(data=rows))
-
-class ScatterPlotButton(discord.ui.Button):
-    def __init__(self, data):
-        super().__init__(label="Show Scatter Plot with Best Fit", style=discord.ButtonStyle.secondary)
-        self.data = data  # Pass the x_values and y_values
-
-    async def callback(self, interaction: discord.Interaction):
-        if not interaction.response.is_done():
-            await interaction.response.defer()
-        x_values, y_values = self.data
-        # Calculate the line of best fit
-        slope, intercept, r_value, _, _ = linregress(x_values, y_values)
-        line = slope * np.array(x_values) + intercept
-
-        # Generate the plot
-        plt.figure(figsize=(8, 6))
-        plt.scatter(x_values, y_values, color='blue', label='Data Points')
-        plt.plot(x_values, line, color='red', label=f'Best Fit Line: y={slope:.2f}x+{intercept:.2f}')
-        plt.title(f"Scatter Plot with Line of Best Fit\nCorrelation Coefficient: {r_value:.2f}")
-        plt.xlabel('X Values')
-        plt.ylabel('Y Values')
-        plt.legend()
-        plt.grid(True)
-
-        # Save and send the updated plot
-        filename = 'scatter_plot.png'
-        plt.savefig(filename)
-        plt.close()
-
-        # Use followup to send the file after initial interaction has been deferred
-        file = discord.File(filename, filename='scatter_plot.png')
-        await interaction.followup.send(content="Updated to Scatter Plot with Best Fit", file=file)
-        os.remove(filename)
-
-class SubmitButton(discord.ui.Button):
-    def __init__(self, data):
-        super().__init__(label="Submit Table", style=discord.ButtonStyle.success, row=data)
-        self.data = data
-
-    async def callback(self, interaction: discord.Interaction):
-        view = self.view
-        plot_path = self.create_plot(view)
-        x_values, y_values = self.extract_data(view)
-        file = discord.File(plot_path, filename="plot.png")
-        
-        # Add the ScatterPlotButton with the data
-        button_view = discord.ui.View()
-        button_view.add_item(ScatterPlotButton((x_values, y_values)))
-        
-        await interaction.response.send_message(file=file, view=button_view)
-        os.remove(plot_path)
-
-    def extract_data(self, view):
-        x_values = [float(view.children[i * 2].label.split()[-1]) for i in range(self.data)]
-        y_values = [float(view.children[i * 2 + 1].label.split()[-1]) for i in range(self.data)]
-        return x_values, y_values
-
-    def create_plot(self, view):
-        x_values = []
-        y_values = []
-        # Loop through each row and gather x and y values
-        for i in range(self.data):  # 'data' contains the number of rows
-            x_values.append(float(view.children[i * 2].label.split()[-1]))  # x values are in even index positions
-            y_values.append(float(view.children[i * 2 + 1].label.split()[-1]))  # y values are in odd index positions
-
-        plt.figure(figsize=(8, 6))
-        plt.plot(x_values, y_values, 'bo-')  # Plot with blue circle markers connected by lines
-        plt.title("Plot of Data Points")
-        plt.xlabel('X Values')
-        plt.ylabel('Y Values')
-        plt.grid(True)
-        filename = 'plot.png'
-        plt.savefig(filename)
-        plt.close()
-        return filename
-
-class QuizButton(discord.ui.Button):
-    def __init__(self, label, option_key, correct, explanation):
-        super().__init__(label=label, style=discord.ButtonStyle.secondary)
-        self.option_key = option_key
-        self.correct = correct
-        self.explanation = explanation
-
-    async def callback(self, interaction: discord.Interaction):
-        view = self.view
-        if self.option_key == view.current_question['answer']:
-            self.style = discord.ButtonStyle.success
-            view.score += 1
-            response = f"Correct! {self.explanation}"
+        session = sessions.get(self.message_id, "table")
+        if session is None:
+            await interaction.response.send_message("This table has expired, please create a new one.", ephemeral=True)
+            return
+        try:
+            session.values[self.index] = float(self.value_input.value)
+        except ValueError:
+            await interaction.response.send_message("Please enter a number.", ephemeral=True)
+            return
+        sessions.touch()
+        # Update the message with the new table state
+        await interaction.response.edit_message(view=table_components(session))
+
+class DataModal(discord.ui.Modal):
+    def __init__(self, degree):
+        super().__init__(title="Paste Data", timeout=600)
+        self.degree = degree
+        # Slash command options are single line, so pasted data is collected here
+        self.data_input = discord.ui.TextInput(
+            label="x,y pairs, one per line (CSV or TSV)",
+            style=discord.TextStyle.paragraph,
+            max_length=4000,
+        )
+        self.add_item(self.data_input)
+
+    async def on_submit(self, interaction: discord.Interaction):
+        await plot_dataset(interaction, self.data_input.value, self.degree)
+
+def plot_table(x_values, y_values):
+    # Markers would hide the line on large datasets
+    marker = 'bo-' if len(x_values) <= 100 else 'b.-'
+
+    def draw(fig):
+        ax = fig.add_subplot()
+        ax.plot(x_values, y_values, marker)  # Plot with blue markers connected by lines
+        ax.set_title("Plot of Data Points")
+        ax.set_xlabel('X Values')
+        ax.set_ylabel('Y Values')
+        ax.grid(True)
+
+    return figure_pool.render(draw, figsize=(8, 6))
+
+def plot_fit(x_values, y_values, fit, residuals=False):
+    """Draw the data with a fitted model, or the model's residuals."""
+    size = 20 if len(x_values) <= 100 else 4
+
+    def draw(fig):
+        ax = fig.add_subplot()
+        if residuals:
+            ax.scatter(x_values, y_values - fit.predict(x_values), color='blue', s=size, label='Residuals')
+            ax.axhline(0, color='red', linewidth=1)
+            ax.set_title(f"Residuals of the {fit.label} Fit\nR² = {fit.r2:.4f}, AIC = {fit.aic:.1f}")
+            ax.set_ylabel('Residual')
         else:
-            self.style = discord.ButtonStyle.danger
-            response = f"Incorrect! Correct answer was '{view.current_question['answer'].upper()}'. {self.explanation}"
+            ax.scatter(x_values, y_values, color='blue', s=size, label='Data Points')
+            ax.plot(*regression.curve(fit, x_values), color='red', label=f'{fit.label}: {fit.equation}')
+            ax.set_title(f"Scatter Plot with {fit.label} Fit\nR² = {fit.r2:.4f}, AIC = {fit.aic:.1f}")
+            ax.set_ylabel('Y Values')
+        ax.set_xlabel('X Values')
+        ax.legend()
+        ax.grid(True)
+
+    return figure_pool.render(draw, figsize=(8, 6))
+
+def render_dataset_fit(message_id, session):
+    """The selected fit of a dataset and its image, fitting and drawing only what isn't cached."""
+    if session.fits is None:
+        session.fits = regression.fit_models(session.x, session.y, session.degree)
+    fit = next((fit for fit in session.fits if fit.model == session.selected), session.fits[0])
+    key = f"{message_id}:{fit.model}:{session.residuals}"
+    png = fit_images.get(key)
+    if png is None:
+        png = plot_fit(session.x, session.y, fit, session.residuals)
+        fit_images.put(key, png)
+    return fit, png
+
+def fit_components(session, shown):
+    """Fits ranked best first, plus a toggle between the fit and its residuals."""
+    options = [
+        discord.SelectOption(label=fit.label, value=fit.model, description=f"R² {fit.r2:.4f}, AIC {fit.aic:.1f}", default=fit is shown)
+        for fit in session.fits
+    ]
+    toggle = "curve" if session.residuals else "residuals"
+    return components(
+        discord.ui.Select(custom_id="dataset:fit", options=options),
+        discord.ui.Button(label=f"Show {'Fit' if session.residuals else 'Residuals'}", style=discord.ButtonStyle.secondary, custom_id=f"dataset:{toggle}"),
+    )
+
+async def send_dataset_plot(interaction: discord.Interaction, x_values, y_values, degree=2):
+    """Plot submitted data and keep the arrays behind the plot's scatter button."""
+    if not interaction.response.is_done():
+        await interaction.response.defer(thinking=True)
+    try:
+        png = await executor.run_io(plot_table, x_values, y_values)
+    except RuntimeError as e:
+        await interaction.followup.send(f"Error plotting the data: {e}")
+        return
 
-        for button in view.children:
-            button.disabled = True
-        await interaction.response.edit_message(content=response, view=view)
+    view = components(discord.ui.Button(label="Show Scatter Plot with Best Fit", style=discord.ButtonStyle.secondary, custom_id="dataset:scatter"))
+    message = await send_png(interaction, png, 'plot.png', content=f"{len(x_values)} points", view=view)
+    sessions.put(message.id, DatasetSession(x_values, y_values, degree))
 
-        await asyncio.sleep(3)  # Optional pause for showing the result
+async def send_private_error(interaction: discord.Interaction, message: str):
+    """Send an error only the user can see, even after a public defer."""
+    if not interaction.response.is_done():
+        await interaction.response.send_message(message, ephemeral=True)
+        return
+    # The first followup after a defer takes over the public "thinking" message, so that goes first
+    await interaction.delete_original_response()
+    await interaction.followup.send(message, ephemeral=True)
 
-        if view.index + 1 < len(view.questions):
-            view.index += 1
-            view.current_question = view.questions[view.index]
-            view.create_question_buttons()
-            await interaction.edit_original_response(content=view.current_question['question'], view=view)
+async def plot_dataset(interaction: discord.Interaction, text: str, degree=2):
+    """Parse pasted or uploaded data and plot it."""
+    try:
+        if interaction.response.is_done():
+            # Uploads were deferred for the download and can be large, so they go to the pool
+            x_values, y_values = await executor.run_io(datasets.parse_points, text)
         else:
-            await interaction.edit_original_response(content=f"Quiz completed! Your score: {view.score}/{len(view.questions)}", view=None)
+            # Pasted data is at most a modal's 4000 characters and parses in well under a
+            # millisecond, so it is parsed right here, within the time to answer privately
+            x_values, y_values = datasets.parse_points(text)
+    except (ValueError, RuntimeError) as e:
+        # RuntimeError covers a full job queue or a timeout
+        await send_private_error(interaction, str(e))
+        return
+    await send_dataset_plot(interaction, x_values, y_values, degree)
 
+async def handle_table(interaction: discord.Interaction, message_id, session, action):
+    if action.startswith("cell:"):
+        await interaction.response.send_modal(TableValueModal(message_id, int(action.split(":")[1])))
+        return
+    if not session.complete:
+        await interaction.response.send_message("Please fill in every value first.", ephemeral=True)
+        return
+    await send_dataset_plot(interaction, *(np.array(column) for column in session.columns()), session.degree)
+
+async def handle_dataset(interaction: discord.Interaction, message_id, session, action):
+    # Switching fits or views redraws at most once; the models are fitted once per dataset
+    if action == "scatter":
+        session.selected = None
+    elif action == "fit":
+        session.selected = interaction.data["values"][0]
+    else:
+        session.residuals = action == "residuals"
+    sessions.touch()
+    await interaction.response.defer()
+    try:
+        fit, png = await executor.run_io(render_dataset_fit, message_id, session)
+    except (RuntimeError, ValueError) as e:
+        await interaction.followup.send(f"Error fitting the data: {e}", ephemeral=True)
+        return
+    content = f"{len(session.x)} points, {fit.label} fit: {fit.equation} (R² = {fit.r2:.4f})"
+    with metrics.timer("upload"):
+        await interaction.edit_original_response(content=content, attachments=[discord.File(BytesIO(png), 'fit.png')], view=fit_components(session, fit))
+
+async def advance_quiz(message_id, edit):
+    """Replace an answered question with the next one, or the final score."""
+    session = sessions.get(message_id, "quiz")
+    if session is None or not session.advance_at:
+        return
+    if session.finished:
+        sessions.pop(message_id)
+        await edit(content=f"Quiz completed! Your score: {session.score}/{len(session.questions)}", view=None)
+        return
+    session.index += 1
+    session.advance_at = 0.0
+    sessions.touch()
+    await edit(content=session.current_question['question'], view=quiz_components(session))
+
+async def handle_quiz(interaction: discord.Interaction, message_id, session, option_key):
+    if session.advance_at:
+        # Clicked while the result is showing, or after a restart lost the scheduled follow-up
+        if time.time() >= session.advance_at:
+            await advance_quiz(message_id, interaction.response.edit_message)
+        else:
+            await interaction.response.defer()
+        return
 
-class MathQuizView(discord.ui.View):
-    def __init__(self, questions):
-        super().__init__()
-        self.questions = questions
-        self.index = 0
-        self.score = 0
-        self.current_question = questions[0]
-        self.create_question_buttons()
-
-    def create_question_buttons(self):
-        self.clear_items()
-        for option_key, value in self.current_question['options'].items():
-            button = QuizButton(
-                label=f"{option_key.upper()}: {value}",
-                option_key=option_key,
-                correct=(option_key == self.current_question['answer']),
-                explanation=self.current_question['explanation']
-            )
-            self.add_item(button)
+    question = session.current_question
+    if option_key == question['answer']:
+        session.score += 1
+        response = f"Correct! {question['explanation']}"
+    else:
+        response = f"Incorrect! Correct answer was '{question['answer'].upper()}'. {question['explanation']}"
+    session.advance_at = time.time() + QUIZ_RESULT_SECONDS
+    sessions.touch()
+    await interaction.response.edit_message(content=response, view=quiz_components(session, option_key))
+    # The result stays up for a moment; nothing waits on it in the meantime
+    follow_ups.schedule(QUIZ_RESULT_SECONDS, advance_quiz, message_id, interaction.edit_original_response)
 
 
 # Create the bot client
@@ -238,124 +482,629 @@ class MyClient(discord.Client):
         self.tree = app_commands.CommandTree(self)
 
     async def setup_hook(self):
+        # Dumping the format takes a few seconds, renders use cold pdflatex until it is done
+        asyncio.get_running_loop().run_in_executor(None, tex_pool.start)
+        prerender_qotd.start()
+        print(f"Restored {sessions.load()} quiz and table sessions")
+        save_sessions.start()
+        self.lag_sampler = asyncio.create_task(sample_loop_lag(metrics))
+        if METRICS_PORT:
+            try:
+                self.metrics_server = await start_http_server(metrics, METRICS_HOST, METRICS_PORT)
+            except OSError as e:
+                print(f"Could not start the metrics endpoint: {e}")
+        if CRONITOR_API_KEY:
+            send_periodic_request.start()
+        if render_workers is not None:
+            check_render_workers.start()
         self.tree.copy_global_to(guild=MY_GUILD)
-        await self.tree.sync(guild=MY_GUILD)
+        await self.sync_commands()
+
+    def command_tree_hash(self):
+        """Hash of the guild's command payloads, as they would be sent to Discord."""
+        commands = sorted((command.to_dict() for command in self.tree.get_commands(guild=MY_GUILD)), key=lambda command: command["name"])
+        payload = json.dumps({"guild": str(MY_GUILD.id), "commands": commands}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def sync_commands(self):
+        """Sync the command tree, unless it is unchanged since the last successful sync."""
+        digest = self.command_tree_hash()
+        try:
+            with open(COMMAND_TREE_HASH_PATH, "r", encoding="utf-8") as f:
+                synced = f.read().strip()
+        except OSError:
+            synced = None
+        if synced == digest and not FORCE_COMMAND_SYNC:
+            print("Command tree unchanged, skipping sync")
+            return
+        with metrics.timer("command_sync"):
+            await self.tree.sync(guild=MY_GUILD)
+        # Only written after Discord accepted the commands, so a failed sync is retried next start
+        os.makedirs(os.path.dirname(COMMAND_TREE_HASH_PATH), exist_ok=True)
+        with open(COMMAND_TREE_HASH_PATH, "w", encoding="utf-8") as f:
+            f.write(digest)
+
+    async def close(self):
+        sessions.save()
+        await super().close()
+
+
+def warm_imports():
+    """Import the heavy modules and build the AI client, off the event loop."""
+    started = time.perf_counter()
+    preload(sp, np, plotting, mathtext_render)
+    symbolic_engine.warm()
+    if hasattr(ai_backend, "warm"):
+        ai_backend.warm()
+    print(f"Warmed up heavy imports in {time.perf_counter() - started:.2f}s")
 
 
 # Initialize intents
 intents = discord.Intents.default()
+intents.message_content = AUTO_RENDER
 client = MyClient(intents=intents)
 
 @client.event
 async def on_ready():
+    global ready_seconds
     print(f'Logged in as {client.user} (ID: {client.user.id})')
     print('------')
+    # on_ready fires again after reconnects, startup only happens once
+    if not ready_seconds:
+        ready_seconds = time.perf_counter() - STARTED_AT
+        print(f'Ready in {ready_seconds:.2f}s')
+        # The first commands would otherwise pay for these imports
+        asyncio.get_running_loop().run_in_executor(None, warm_imports)
     await client.change_presence(activity=discord.Activity(type=discord.ActivityType.watching, name="Mathematical Equations 🤓"))
 
+@client.event
+async def on_interaction(interaction: discord.Interaction):
+    # Quiz and table buttons are routed here by custom_id instead of through per-message views
+    if interaction.type != discord.InteractionType.component:
+        return
+    kind, _, action = interaction.data.get("custom_id", "").partition(":")
+    if kind not in ("quiz", "table", "dataset"):
+        return
+    message_id = interaction.message.id
+    session = sessions.get(message_id, kind)
+    if session is None:
+        name = "quiz" if kind == "quiz" else "table"
+        await interaction.response.send_message(f"This {name} has expired, please start a new one.", ephemeral=True)
+        return
+    if kind == "quiz":
+        await handle_quiz(interaction, message_id, session, action)
+    elif kind == "table":
+        await handle_table(interaction, message_id, session, action)
+    else:
+        await handle_dataset(interaction, message_id, session, action)
+
+@client.event
+async def on_message(message: discord.Message):
+    if message.author.bot or not auto_renderer.enabled(message.channel.id):
+        return
+    auto_renderer.feed(message.id, message.channel.id, message.content, message.guild.id if message.guild else None, message.author.id)
+
+@client.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    # Raw, because edits to messages that fell out of the cache count too
+    if not auto_renderer.enabled(payload.channel_id) or "content" not in payload.data:
+        return
+    author = payload.data.get("author", {})
+    if author.get("bot"):
+        return
+    author_id = int(author["id"]) if "id" in author else None
+    auto_renderer.feed(payload.message_id, payload.channel_id, payload.data["content"], payload.guild_id, author_id)
+
+@client.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    tracked = auto_renderer.forget(payload.message_id)
+    if tracked is not None and tracked.reply is not None:
+        try:
+            await tracked.reply.delete()
+        except discord.HTTPException:
+            pass
+
+@client.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    # Measured from when Discord created the interaction, so it includes gateway delay
+    elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    metrics.observe("command_seconds", elapsed, command.qualified_name)
+
 @tasks.loop(minutes=5)
 async def send_periodic_request():
     guild_count = len(client.guilds)
     ping = round(client.latency * 1000)
-    monitor.ping(metrics={'guilds': guild_count, 'ping': ping})
+    payload = {'guilds': guild_count, 'ping': ping, **metrics.summary()}
+    # The Cronitor client is blocking, keep it off the event loop
+    await asyncio.get_running_loop().run_in_executor(None, lambda: monitor.ping(metrics=payload))
 
 @send_periodic_request.before_loop
 async def before_send_request():
     await client.wait_until_ready()
     print("Starting periodic check-ins.")
 
-def visualize_equation(equation: str):
-    """Generate a PDF from the given LaTeX equation and convert it to PNG, ensuring visibility with padding."""
-    wrapped_equation = NoEscape(f"\\[{equation}\\]")
-
-    # Generate file paths
-    current_timestamp = int(time.mktime(time.strptime("2024-01-01", "%Y-%m-%d")))
-    epoch_time = str(int(time.time() - current_timestamp))
-    output_dir = 'bot/tmp'
-    os.makedirs(output_dir, exist_ok=True)
-    base_filename = os.path.join(output_dir, f'{epoch_time}')
-    pdf_filename = f'{base_filename}.pdf'
-    png_filename = f'{base_filename}.png'
-
-    # Create LaTeX document with a standalone class and geometry for padding
-    doc = Document(documentclass='standalone', document_options=['12pt'])
-    doc.packages.append(NoEscape(r'\usepackage[top=1in, bottom=1in, left=1in, right=1in]{geometry}'))  # Larger margins
-    doc.packages.append(NoEscape(r'\usepackage{amsmath}'))
-    with doc.create(Math(data=wrapped_equation)):
-        pass
-
-    # Compile LaTeX to PDF
-    try:
-        doc.generate_pdf(base_filename, clean_tex=True, compiler='pdflatex')
-    except subprocess.CalledProcessError as e:
-        print(f"LaTeX warnings: {e}")
-    except Exception as e:
-        raise RuntimeError(f"LaTeX Error: {e}")
+@tasks.loop(seconds=10)
+async def check_render_workers():
+    health = await render_workers.check_health()
+    down = [name for name, healthy in health.items() if not healthy]
+    if down:
+        print(f"Render workers not responding: {', '.join(down)}")
 
-    # Convert generated PDF to PNG
-    try:
-        pages = convert_from_path(pdf_filename)
-        first_page = pages[0]
-        first_page.save(png_filename, 'PNG')
-    except Exception as e:
-        raise RuntimeError(f"Error converting PDF to PNG: {e}")
+def use_workers():
+    """Whether jobs should go to the render worker service."""
+    return render_workers is not None and render_workers.available
 
-    # Clean up auxiliary files
-    for ext in ['.aux', '.log', '.tex', '.pdf']:
-        file_path = f"{base_filename}{ext}"
-        if os.path.exists(file_path):
-            os.remove(file_path)
+async def shared_job(key, remote, local):
+    """Run a job on a render worker, or locally when there is none, joining an identical job already running."""
+    if use_workers():
+        try:
+            return await render_flight.do(("remote", *key), remote)
+        except NoWorkerError:
+            # No worker could take it, so this process does the job itself
+            pass
+    return await render_flight.do(key, local)
+
+def qotd_window():
+    """Dates whose QOTD image is kept ready: yesterday, today and the next few days."""
+    today = datetime.date.today()
+    return [(today + datetime.timedelta(days=offset)).isoformat() for offset in range(-1, QOTD_PRERENDER_DAYS)]
+
+@tasks.loop(seconds=30)
+async def save_sessions():
+    sessions.evict_expired()
+    await executor.run_io(sessions.save)
+
+@tasks.loop(minutes=10)
+async def prerender_qotd():
+    """Render upcoming QOTD images so nobody waits on pdflatex when the question changes."""
+    dates = qotd_window()
+    for date in dates:
+        question_data = question_store.qotd(date)
+        if not question_data:
+            qotd_images.pop(date, None)
+            continue
+        stored = qotd_images.get(date)
+        # Only re-render when the question text was edited
+        if stored and stored[0] == question_data['question']:
+            continue
+        try:
+            png = await render_equation_shared(question_data['question'])
+        except RuntimeError as e:
+            print(f"Could not pre-render the QOTD for {date}: {e}")
+            continue
+        qotd_images[date] = (question_data['question'], png)
+    for date in list(qotd_images):
+        if date not in dates:
+            del qotd_images[date]
+
+@prerender_qotd.before_loop
+async def before_prerender_qotd():
+    await client.wait_until_ready()
 
-    return png_filename
+def output_options(dpi=None, fmt=None, theme=None):
+    """The output settings for a render, filling in the defaults."""
+    return {"dpi": dpi or OUTPUT_DPI, "format": fmt or OUTPUT_FORMAT, "theme": theme or OUTPUT_THEME}
 
-def preprocess_expression(expression: str) -> str:
-    expression = get_AI_prompt(expression)
+def image_filename(stem: str, fmt=None) -> str:
+    return f"{stem}.{fmt or OUTPUT_FORMAT}"
 
-    # Further processing rules can be added here
-    return expression
+def validate_equation(equation: str):
+    """Raise LatexError for input that can't be typeset, before any renderer is started."""
+    try:
+        check_latex(equation, MAX_LATEX_LENGTH, MAX_LATEX_NESTING)
+    except LatexError as e:
+        rejected_equations[e.reason] += 1
+        raise
+
+def compile_equation(equation: str) -> bytes:
+    """Compile the given LaTeX equation and return the PDF bytes."""
+    validate_equation(equation)
+    if tex_pool.ready:
+        # Warm path: only the equation body is typeset, the preamble comes from the format
+        with metrics.timer("pdflatex"):
+            return tex_pool.compile(f"\\[{equation}\\]")
+
+    from pylatex import Document, Math, NoEscape
+    with metrics.timer("tex_build"):
+        # Standalone crops the page to the equation, the border keeps antialiasing off the edge
+        doc = Document(documentclass='standalone', document_options=['12pt', 'border=4pt'])
+        doc.packages.append(NoEscape(r'\usepackage{amsmath}'))
+        doc.packages.append(NoEscape(r'\usepackage{amssymb}'))
+        # Math already wraps its content in \[...\]
+        with doc.create(Math(data=NoEscape(equation))):
+            pass
+
+    # Compile LaTeX to PDF in a private scratch directory so concurrent renders never collide
+    with scratch_dir() as workdir:
+        base_filename = os.path.join(workdir, 'equation')
+        try:
+            with metrics.timer("pdflatex"):
+                doc.generate_pdf(base_filename, clean_tex=True, compiler='pdflatex')
+        except subprocess.CalledProcessError as e:
+            print(f"LaTeX warnings: {e}")
+        except Exception as e:
+            raise RuntimeError(f"LaTeX Error: {e}")
+
+        try:
+            with open(f'{base_filename}.pdf', 'rb') as pdf_file:
+                return pdf_file.read()
+        except OSError as e:
+            raise RuntimeError(f"LaTeX Error: {e}")
+
+def equation_pdf(equation: str) -> bytes:
+    """The compiled PDF for an equation, kept so other sizes and themes don't recompile."""
+    key = make_key(equation, {**RENDER_SETTINGS, "engine": "pdf"})
+    pdf = render_cache.get(key)
+    if pdf is None:
+        pdf = compile_equation(equation)
+        render_cache.put(key, pdf)
+    return pdf
+
+def visualize_equation(equation: str, dpi=None, fmt=None, theme=None) -> bytes:
+    """Rasterize the equation's PDF at the given DPI and return the encoded image."""
+    output = output_options(dpi, fmt, theme)
+    pdf = equation_pdf(equation)
+    with metrics.timer("rasterize"):
+        image = rasterize_pdf(pdf, dpi=output["dpi"])
+    with metrics.timer("encode"):
+        return encode_image(image, output["format"], output["theme"])
+
+def equation_engine(equation: str) -> str:
+    return "mathtext" if MATHTEXT_FAST_PATH and mathtext_render.can_use_mathtext(equation) else "pdflatex"
+
+def equation_key(equation: str, output: dict, engine: str) -> str:
+    return make_key(equation, {**RENDER_SETTINGS, **output, "engine": engine})
+
+def cached_equation(equation: str, dpi=None, fmt=None, theme=None):
+    """The image for an equation if it is in the memory cache, looked up without leaving the event loop."""
+    output = output_options(dpi, fmt, theme)
+    return render_cache.peek(equation_key(equation, output, equation_engine(equation)))
+
+def render_equation(equation: str, dpi=None, fmt=None, theme=None) -> bytes:
+    """Return the image bytes for an equation, only rendering it on a cache miss."""
+    output = output_options(dpi, fmt, theme)
+    engine = equation_engine(equation)
+    key = equation_key(equation, output, engine)
+    png = render_cache.get(key)
+    if png is None:
+        if engine == "mathtext":
+            try:
+                with metrics.timer("mathtext"):
+                    image = open_png(mathtext_render.render_mathtext(equation, dpi=output["dpi"]))
+                with metrics.timer("encode"):
+                    png = encode_image(image, output["format"], output["theme"])
+            except ValueError:
+                # The classifier let through something mathtext can't parse
+                engine = "pdflatex"
+        if png is None:
+            png = visualize_equation(equation, output["dpi"], output["format"], output["theme"])
+        render_cache.put(key, png)
+        render_engine_counts[engine] += 1
+    return png
+
+async def render_equation_shared(equation: str, dpi=None, fmt=None, theme=None) -> bytes:
+    """render_equation on the worker pool, joining an identical render that is already running."""
+    # Bad input is turned away here, without a trip to a worker or the executor
+    validate_equation(equation)
+    # Cache hits are answered right away instead of taking a place in the job queue
+    png = cached_equation(equation, dpi, fmt, theme)
+    if png is not None:
+        return png
+    key = ("equation", normalize_equation(equation), *output_options(dpi, fmt, theme).values())
+    return await shared_job(
+        key,
+        lambda: remote_render(equation, dpi, fmt, theme),
+        lambda: executor.run_io(render_equation, equation, dpi, fmt, theme),
+    )
+
+async def remote_render(equation, dpi=None, fmt=None, theme=None) -> bytes:
+    _, png = await render_workers.call("render", equation=equation, dpi=dpi, fmt=fmt, theme=theme)
+    # The worker cached it in its own process, this keeps the next request from going back to it
+    render_cache.remember(equation_key(equation, output_options(dpi, fmt, theme), equation_engine(equation)), png)
+    return png
+
+def split_equations(text: str):
+    """One equation per non-empty line."""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+def render_batch_equations(equations, theme=None):
+    """Render several equations, typesetting every one that needs LaTeX in a single run.
+
+    Returns a (image bytes or None, error message or None) pair per equation.
+    """
+    output = output_options(theme=theme)
+    batch_settings = {**RENDER_SETTINGS, **output, "engine": "pdflatex-batch"}
+    results = [None] * len(equations)
+    pending = []
+    for index, equation in enumerate(equations):
+        try:
+            validate_equation(equation)
+        except LatexError as e:
+            # Kept out of the batch, where it could break every other equation's page
+            results[index] = (None, str(e))
+            continue
+        if MATHTEXT_FAST_PATH and mathtext_render.can_use_mathtext(equation):
+            results[index] = (render_equation(equation, theme=theme), None)
+            continue
+        png = render_cache.get(make_key(equation, batch_settings))
+        if png is not None:
+            results[index] = (png, None)
+        else:
+            pending.append(index)
+
+    if not pending:
+        return results
+
+    try:
+        with metrics.timer("pdflatex_batch"):
+            compiled = compile_batch([equations[index] for index in pending], dpi=output["dpi"])
+    except BatchMismatchError as e:
+        # Something broke the page layout, so fall back to one render per equation
+        print(f"Batch render fell back to single renders: {e}")
+        for index in pending:
+            try:
+                results[index] = (render_equation(equations[index], theme=theme), None)
+            except RuntimeError as error:
+                results[index] = (None, str(error))
+        return results
+
+    for index, (image, error) in zip(pending, compiled):
+        if image is None:
+            results[index] = (None, error)
+            continue
+        png = encode_image(image, output["format"], output["theme"])
+        render_cache.put(make_key(equations[index], batch_settings), png)
+        results[index] = (png, None)
+    render_engine_counts["pdflatex-batch"] += len(pending)
+    return results
+
+def build_batch_attachments(equations, layout):
+    """Return the (filename, image bytes) attachments and error lines for a batch."""
+    # Stacking works on dark-on-white images, the theme is applied to the composite
+    results = render_batch_equations(equations, theme="light" if layout == "stacked" else None)
+    errors = [f"**{index + 1}.** `{equations[index]}`: {error}" for index, (_, error) in enumerate(results) if error]
+    images = [(index, png) for index, (png, _) in enumerate(results) if png]
+    if layout == "stacked" and images:
+        composite = stack_images([open_png(png) for _, png in images])
+        return [(image_filename("equations"), encode_image(composite, OUTPUT_FORMAT, OUTPUT_THEME))], errors
+    return [(image_filename(f"equation_{index + 1}"), png) for index, png in images], errors
+
+async def batch_attachments(equations, layout):
+    """build_batch_attachments, on a render worker when there is one (images come back one frame each)."""
+    if use_workers():
+        attachments, errors = [], []
+        try:
+            async for header, png in render_workers.stream("batch", equations=equations, layout=layout):
+                if header["status"] == "chunk":
+                    attachments.append((header["value"], png))
+                else:
+                    errors = header["value"]
+            return attachments, errors
+        except NoWorkerError:
+            # Raised before any image arrived, so the batch starts over here
+            pass
+    return await executor.run_io(build_batch_attachments, equations, layout)
+
+async def send_batch(interaction: discord.Interaction, equations, layout):
+    """Render a batch of equations and send the images, reporting failures per equation."""
+    if not equations:
+        await interaction.response.send_message("There is nothing to render.", ephemeral=True)
+        return
+    if len(equations) > MAX_BATCH:
+        await interaction.response.send_message(f"Please send at most {MAX_BATCH} equations at a time.", ephemeral=True)
+        return
+    # One LaTeX run, but a long batch still holds pdflatex for longer
+    ticket = await admit(interaction, "batch", cost=1 + len(equations) / 5)
+    if ticket is None:
+        return
 
+    if not interaction.response.is_done():
+        await interaction.response.defer(ephemeral=False, thinking=True)
+    try:
+        async with ticket:
+            attachments, errors = await batch_attachments(equations, layout)
+    except RuntimeError as e:
+        await interaction.followup.send(f"Error rendering the equations: {e}")
+        return
 
-def plot_function(expression: str):
+    content = None
+    if errors:
+        content = ("Some equations could not be rendered:\n" + "\n".join(errors))[:2000]
+    if not attachments:
+        await interaction.followup.send(content)
+        return
+    # Discord allows at most 10 attachments per message
+    for start in range(0, len(attachments), 10):
+        files = [discord.File(BytesIO(png), filename) for filename, png in attachments[start:start + 10]]
+        with metrics.timer("upload"):
+            await interaction.followup.send(content=content if start == 0 else None, files=files)
+
+def inline_math_filename(segment: str) -> str:
+    # Named after the segment, so unchanged segments can be matched to the reply's attachments
+    digest = hashlib.sha1(normalize_equation(segment).encode("utf-8")).hexdigest()[:12]
+    return image_filename(f"math_{digest}")
+
+async def update_inline_math(message_id, tracked, content):
+    """Bring the auto-render reply to a message in line with its math, rendering only new segments."""
+    segments = find_segments(content)
+    if not segments:
+        if tracked.reply is not None:
+            await tracked.reply.delete()
+            tracked.reply = None
+        return
 
-    # Strip 'y=' or 'f(x)=' if it exists to get just the RHS
-    if '=' in expression:
-        expression = expression.split('=')[1]
+    names = {segment: inline_math_filename(segment) for segment in segments}
+    # Attachments already on the reply are kept as they are instead of being uploaded again
+    kept = {attachment.filename: attachment for attachment in tracked.reply.attachments} if tracked.reply else {}
+    fresh = [segment for segment in segments if names[segment] not in kept]
+    rendered = {}
+    for segment in fresh:
+        png = cached_equation(segment)
+        if png is not None:
+            rendered[segment] = png
+    missing = [segment for segment in fresh if segment not in rendered]
+    results = []
+    if missing:
+        try:
+            ticket = admission.admit(tracked.author_id, tracked.guild_id, "auto_render", cost=len(missing))
+        except AdmissionError:
+            # Nobody asked for this render, so when the bot is busy the reply just stays as it is
+            return
+        async with ticket:
+            results = await asyncio.gather(*(render_equation_shared(segment) for segment in missing), return_exceptions=True)
+    errors = []
+    for segment, result in zip(missing, results):
+        if isinstance(result, Exception):
+            errors.append(f"Could not render `{segment}`: {result}")
+        else:
+            rendered[segment] = result
+
+    attachments = []
+    for segment in segments:
+        if names[segment] in kept:
+            attachments.append(kept[names[segment]])
+        elif segment in rendered:
+            attachments.append(discord.File(BytesIO(rendered[segment]), names[segment]))
+    text = "\n".join(errors)[:2000] or None
+    with metrics.timer("upload"):
+        if tracked.reply is not None:
+            tracked.reply = await tracked.reply.edit(content=text, attachments=attachments)
+            return
+        channel = client.get_channel(tracked.channel_id) or await client.fetch_channel(tracked.channel_id)
+        tracked.reply = await channel.send(
+            content=text,
+            files=attachments,
+            reference=channel.get_partial_message(message_id),
+            mention_author=False,
+            allowed_mentions=discord.AllowedMentions.none(),
+        )
+
+auto_renderer = AutoRenderer(
+    update_inline_math,
+    debounce=float(os.getenv("AUTO_RENDER_DEBOUNCE", "1.5")),
+    rate=int(os.getenv("AUTO_RENDER_RATE", "5")),
+    per=10.0,
+)
+metrics.gauge("auto_render", "Inline math auto-render: channels, tracked messages, updates and skipped edits.", auto_renderer.stats)
+
+async def preprocess_expression(expression: str) -> str:
+    expression = await get_AI_prompt(expression)
 
-    # Preprocess the expression to correct common syntax issues
-    expression = preprocess_expression(expression)
+    # Further processing rules can be added here
+    return expression
 
-    # Create a range of x values
-    x = np.linspace(-10, 10, 400)
-    
+async def prepare_plot_expressions(expression: str):
+    """Split ';'-separated functions and preprocess them all at once."""
+    parts = []
+    for part in plotting.split_expressions(expression):
+        # Strip 'y=' or 'f(x)=' if it exists to get just the RHS
+        if '=' in part:
+            part = part.split('=')[1]
+        parts.append(part)
+    # Preprocess the expressions to correct common syntax issues
+    return await asyncio.gather(*(preprocess_expression(part) for part in parts))
+
+def plot_function(expressions, x_min=-10.0, x_max=10.0):
+    """Plot already preprocessed functions and return (PNG bytes, error)."""
     try:
-        # Convert the string expression to a sympy expression and then to a numpy function
-        expr = sp.sympify(expression)
-        f = sp.lambdify(sp.Symbol('x'), expr, 'numpy')
-        
-        # Calculate y values based on the expression
-        y = f(x)
-        
-        # Create the plot
-        plt.figure(figsize=(8, 6))
-        plt.plot(x, y, label=f"y = {expression}")
-        plt.title(f"Plot of y = {expression}")
-        plt.xlabel('x')
-        plt.ylabel('y')
-        plt.grid(True)
-        plt.legend()
-
-        # Save the plot to a file
-        filename = 'plot.png'
-        plt.savefig(filename)
-        plt.close()
-
-        return filename, None  # Return the filename and no error
+        curves = []
+        for part in expressions:
+            x, y = plotting.sample_function(part, x_min, x_max)
+            curves.append((part, x, y))
+        if not curves:
+            return None, "No function to plot."
+        return draw_function_plot(curves, x_min, x_max), None  # Return the image and no error
     except Exception as e:
-        return None, str(e)  # Return no filename and the error message
+        return None, str(e)  # Return no image and the error message
+
+def plot_key(expressions, x_min, x_max) -> str:
+    normalized = ";".join(plotting.normalize_expression(expression) for expression in expressions)
+    return make_key(normalized, {**PLOT_SETTINGS, "x_min": x_min, "x_max": x_max})
+
+def cached_plot(expressions, x_min=-10.0, x_max=10.0):
+    """plot_function, keeping successful plots in the render cache."""
+    key = plot_key(expressions, x_min, x_max)
+    png = render_cache.get(key)
+    if png is not None:
+        return png, None
+    png, error = plot_function(expressions, x_min, x_max)
+    if png is not None:
+        render_cache.put(key, png)
+    return png, error
+
+async def plot_function_shared(expressions, x_min=-10.0, x_max=10.0):
+    """plot_function on the worker pool, joining an identical plot that is already running."""
+    png = render_cache.peek(plot_key(expressions, x_min, x_max))
+    if png is not None:
+        return png, None
+    key = ("plot", tuple(plotting.normalize_expression(expression) for expression in expressions), x_min, x_max)
+    return await shared_job(
+        key,
+        lambda: remote_plot(expressions, x_min, x_max),
+        lambda: executor.run_io(metrics.timed("plot", cached_plot), expressions, x_min, x_max),
+    )
+
+async def remote_plot(expressions, x_min, x_max):
+    header, png = await render_workers.call("plot", expressions=list(expressions), x_min=x_min, x_max=x_max)
+    if png:
+        render_cache.remember(plot_key(expressions, x_min, x_max), png)
+    return png or None, header["value"]
+
+async def run_symbolic(operation: str, expression: str, point=None) -> str:
+    """Run a sympy operation on a render worker, or in a local sandbox."""
+    if use_workers():
+        try:
+            header, _ = await render_workers.call("sympy", operation=operation, expression=expression, point=point)
+            return header["value"]
+        except NoWorkerError:
+            pass
+    return await executor.run_io(metrics.timed("sympy", symbolic_engine.compute), operation, expression, point)
+
+async def run_draw_shape(shape, side1, side2=None, side3=None) -> bytes:
+    """draw_shape on a render worker or the worker pool, joining an identical drawing that is already running."""
+    cache_key = geometry.canonicalize(shape, side1, side2, side3).cache_key
+    png = render_cache.peek(make_key(cache_key, SHAPE_SETTINGS))
+    if png is not None:
+        return png
+    return await shared_job(
+        ("shape", cache_key),
+        lambda: remote_draw(shape, side1, side2, side3),
+        lambda: executor.run_io(metrics.timed("draw", draw_shape), shape, side1, side2, side3),
+    )
+
+async def remote_draw(shape, side1, side2=None, side3=None) -> bytes:
+    _, png = await render_workers.call("draw", shape=shape, side1=side1, side2=side2, side3=side3)
+    render_cache.remember(make_key(geometry.canonicalize(shape, side1, side2, side3).cache_key, SHAPE_SETTINGS), png)
+    return png
+
+def draw_function_plot(curves, x_min, x_max):
+    def draw(fig):
+        # Create the plot
+        ax = fig.add_subplot()
+        for expression, x, y in curves:
+            ax.plot(x, y, label=f"y = {expression}")
+        limits = plotting.view_limits([(x, y) for _, x, y in curves])
+        if limits:
+            ax.set_ylim(*limits)
+        ax.set_xlim(x_min, x_max)
+        ax.set_title("Plot of " + ", ".join(f"y = {expression}" for expression, _, _ in curves))
+        ax.set_xlabel('x')
+        ax.set_ylabel('y')
+        ax.grid(True)
+        ax.legend()
+
+    # Render the plot into memory
+    return figure_pool.render(draw, figsize=(8, 6))
 
  
-def get_AI_prompt(equation: str):
-    response = model.generate_content(f"{prompt} {equation}")
-    return format_to_latex(response.text)
+async def get_AI_prompt(equation: str):
+    response = await translator.translate(equation)
+    return format_to_latex(response)
+
+async def get_AI_latex(equation: str):
+    """LaTeX for a plain-text equation, with any math delimiters the model added removed."""
+    response = await translator.translate(equation)
+    return response.strip().replace(r"\(", "").replace(r"\)", "").replace(r"\[", "").replace(r"\]", "").strip("$ \n")
 
 def format_to_latex(expression: str):
     # Remove LaTeX specific delimiters
@@ -378,47 +1127,110 @@ def sympy_to_latex(expression):
     latex_output = latex_output.replace(r'\left(', '(').replace(r'\right)', ')')
     return latex_output
 
-# Function to plot a triangle
-def plot_triangle(a, b, c):
-    # Calculate the coordinates based on the triangle inequality and angles
-    coords = [(0, 0), (a, 0)]  # Start with two points
-    # Use law of cosines to find the angle between the sides
-    angle = np.arccos((a**2 + b**2 - c**2) / (2 * a * b))
-    # Third vertex coordinates
-    x = b * np.cos(angle)
-    y = b * np.sin(angle)
-    coords.append((x, y))
-    coords.append((0, 0))  # Close the triangle
-    x, y = zip(*coords)
-    plt.figure()
-    plt.plot(x, y, marker='o')
-    plt.fill(x, y, 'b', alpha=0.3)  # Fill with light blue
-    plt.gca().set_aspect('equal', adjustable='box')
-    plt.axis('off')
-
-# Function to plot a circle
-def plot_circle(radius):
-    circle = plt.Circle((0, 0), radius, color='r', fill=False)
-    fig, ax = plt.subplots()
-    ax.add_artist(circle)
-    ax.set_xlim(-radius-1, radius+1)
-    ax.set_ylim(-radius-1, radius+1)
-    ax.set_aspect('equal', adjustable='box')
-    ax.axis('off')
-
-# Function to plot a rectangle
-def plot_rectangle(width, height):
-    rectangle = plt.Rectangle((-width/2, -height/2), width, height, fill=None, color='g')
-    fig, ax = plt.subplots()
-    ax.add_artist(rectangle)
-    ax.set_xlim(-width, width)
-    ax.set_ylim(-height, height)
-    ax.set_aspect('equal', adjustable='box')
-    ax.axis('off')
-
-# Function to plot a square
-def plot_square(side):
-    plot_rectangle(side, side)
+def render_shape(shape: geometry.Shape) -> bytes:
+    """Draw a canonical shape with its sides, angles and measurements labelled."""
+    color = {"triangle": 'b', "circle": 'r'}.get(shape.kind, 'g')
+
+    def draw(fig):
+        ax = fig.add_subplot()
+        if shape.kind == "circle":
+            from matplotlib.patches import Circle
+            # Drawn with radius 1, the label carries the real size
+            ax.add_artist(Circle((0, 0), 1, color=color, fill=False))
+            ax.plot([0, 1], [0, 0], color=color, linestyle='--', marker='o', markevery=[0])
+            ax.annotate(f"r = {geometry.fmt(shape.sides[0])}", (0.5, 0), xytext=(0, 6), textcoords='offset points', ha='center')
+            ax.set_xlim(-1.2, 1.2)
+            ax.set_ylim(-1.2, 1.2)
+            ax.set_aspect('equal', adjustable='box')
+        else:
+            corners = shape.vertices
+            x, y = zip(*corners, corners[0])
+            ax.plot(x, y, color=color, marker='o' if shape.kind == "triangle" else None)
+            ax.fill(x, y, color, alpha=0.3)
+            center = (sum(x for x, _ in corners) / len(corners), sum(y for _, y in corners) / len(corners))
+            # Label each side at its midpoint, pushed outwards; rectangles only need two
+            lengths = shape.sides if shape.kind == "triangle" else (shape.sides[0], shape.sides[-1])
+            for index, length in enumerate(lengths):
+                (x1, y1), (x2, y2) = corners[index], corners[(index + 1) % len(corners)]
+                middle = ((x1 + x2) / 2, (y1 + y2) / 2)
+                ax.annotate(geometry.fmt(length), middle, xytext=outward(middle, center, 14), textcoords='offset points', ha='center', va='center')
+            if shape.kind == "triangle":
+                for corner, angle in zip(corners, shape.angles):
+                    # Angles sit just inside their corner
+                    ax.annotate(f"{geometry.fmt(angle)}°", corner, xytext=outward(corner, center, -22), textcoords='offset points', ha='center', va='center', fontsize=8)
+            ax.set_aspect('equal', adjustable='datalim')
+        ax.set_title(shape.summary().replace(" | ", "    "), fontsize=9)
+        ax.axis('off')
+
+    return figure_pool.render(draw, figsize=(6.4, 4.8))
+
+def outward(point, center, distance):
+    """Offset in points that moves a label away from (or, if negative, towards) the center."""
+    dx, dy = point[0] - center[0], point[1] - center[1]
+    norm = (dx * dx + dy * dy) ** 0.5 or 1.0
+    return (dx / norm * distance, dy / norm * distance)
+
+def draw_shape(shape, side1, side2=None, side3=None):
+    """Return the PNG bytes of a shape, drawing it only if nothing that looks the same was drawn before."""
+    measured = geometry.canonicalize(shape, side1, side2, side3)
+    key = make_key(measured.cache_key, SHAPE_SETTINGS)
+    png = render_cache.get(key)
+    if png is None:
+        png = render_shape(measured)
+        render_cache.put(key, png)
+    return png
+
+async def admit(interaction: discord.Interaction, kind: str, cost=1.0):
+    """An admission ticket for a heavy command, or None once the user has been told why not."""
+    try:
+        ticket = admission.admit(interaction.user.id, interaction.guild_id, kind, cost)
+    except AdmissionError as e:
+        # Commands that ask the AI first have deferred by the time they are admitted
+        await send_private_error(interaction, str(e))
+        return None
+    if ticket.must_wait and not interaction.response.is_done():
+        # Discord wants an answer within 3 seconds, the queue may take longer
+        await interaction.response.defer(ephemeral=False, thinking=True)
+    return ticket
+
+def admitted(kind: str, cost=1.0):
+    """Run a command callback under admission control, holding a job slot while it runs."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(interaction: discord.Interaction, *args, **kwargs):
+            ticket = await admit(interaction, kind, cost)
+            if ticket is None:
+                return
+            async with ticket:
+                await fn(interaction, *args, **kwargs)
+        return wrapper
+    return decorator
+
+async def send_png(interaction: discord.Interaction, png: bytes, filename: str, **kwargs):
+    """Send PNG bytes as the response, or as a followup once there is one, timing the upload."""
+    with metrics.timer("upload"):
+        if not interaction.response.is_done():
+            # Cache hits are sent straight away, without deferring first
+            return await interaction.response.send_message(file=discord.File(BytesIO(png), filename), **kwargs)
+        return await interaction.followup.send(file=discord.File(BytesIO(png), filename), **kwargs)
+
+async def send_equation(interaction: discord.Interaction, equation: str, kind="render", dpi=None, fmt=None, theme=None):
+    """Render an equation and send it, only admitting a job when it isn't in the memory cache."""
+    try:
+        png = cached_equation(equation, dpi, fmt, theme)
+        if png is None:
+            ticket = await admit(interaction, kind)
+            if ticket is None:
+                return
+            if not interaction.response.is_done():
+                await interaction.response.defer(ephemeral=False, thinking=True)
+            async with ticket:
+                png = await render_equation_shared(equation, dpi, fmt, theme)
+        await send_png(interaction, png, image_filename('equation', fmt))
+    except (RuntimeError, ValueError) as e:
+        await interaction.followup.send(f"Error rendering the equation: {e}")
+    except Exception as e:
+        await interaction.followup.send("An unexpected error occurred while rendering the equation.")
 
 def get_dynamic_time():
     # Current time in epoch seconds
@@ -427,130 +1239,175 @@ def get_dynamic_time():
     return f"<t:{epoch_time}:R>"
 
 def get_qotd_data():
-    """Fetches the question of the day data from the JSON file."""
-    current_date = time.strftime("%Y-%m-%d")
-    with open('bot/qotd.json', 'r') as f:
-        qotd_questions = json.load(f)
-    return qotd_questions.get(current_date, {"question": "No question today!", "hint": "", "answer": ""})
+    """Fetches the question of the day data from the question store."""
+    return question_store.qotd_today() or {"question": "No question today!", "hint": "", "answer": ""}
+
+async def get_qotd_image(date: str, question: str) -> bytes:
+    """The pre-rendered image for a QOTD, rendering it now only if it is missing or stale."""
+    stored = qotd_images.get(date)
+    if stored and stored[0] == question:
+        return stored[1]
+    png = await render_equation_shared(question)
+    if date in qotd_window():
+        qotd_images[date] = (question, png)
+    return png
 
 @client.tree.command()
-@app_commands.describe(equation="Enter the equation in LaTeX format.")
-async def render(interaction: discord.Interaction, equation: str):
+@app_commands.describe(
+    equation="Enter the equation in LaTeX format.",
+    dpi="Resolution of the image (default 200).",
+    image_format="PNG or the smaller WebP.",
+    theme="Dark text on white, light text for dark mode, or a transparent background.",
+)
+@app_commands.choices(
+    dpi=[app_commands.Choice(name=str(value), value=value) for value in (100, 200, 300, 600)],
+    image_format=[app_commands.Choice(name=value.upper(), value=value) for value in FORMATS],
+    theme=[app_commands.Choice(name=value.title(), value=value) for value in THEMES],
+)
+async def render(interaction: discord.Interaction, equation: str, dpi: int = None, image_format: str = None, theme: str = None):
     """Render a LaTeX equation and return it as an image."""
-    try:
-        image_path = visualize_equation(equation)
-        with open(image_path, 'rb') as image_file:
-            await interaction.response.send_message(file=discord.File(image_file, os.path.basename(image_path)))
-        os.remove(image_path)
-    except RuntimeError as e:
-        await interaction.response.send_message(f"Error rendering the equation: {e}")
-    except Exception as e:
-        await interaction.response.send_message("An unexpected error occurred while rendering the equation.")
+    await send_equation(interaction, equation, "render", dpi, image_format, theme)
 
 @client.tree.context_menu(name="Render LaTeX")
 async def render_latex_menu(interaction: discord.Interaction, message: discord.Message):
     """Render a LaTeX equation from a context menu command."""
     equation = message.content.strip()
     if equation:
-        try:
-            image_path = visualize_equation(equation)
-            with open(image_path, 'rb') as image_file:
-                await interaction.response.send_message(file=discord.File(image_file, os.path.basename(image_path)))
-            os.remove(image_path)
-        except RuntimeError as e:
-            await interaction.response.send_message(f"Error rendering the equation: {e}")
-        except Exception as e:
-            await interaction.response.send_message("An unexpected error occurred while rendering the equation.")
+        await send_equation(interaction, equation)
     else:
         await interaction.response.send_message("The message doesn't contain any content.")
 
+@client.tree.command()
+@app_commands.describe(enabled="Render $...$ math in this channel's messages automatically.")
+@app_commands.default_permissions(manage_channels=True)
+async def auto_render(interaction: discord.Interaction, enabled: bool):
+    """Turn automatic rendering of inline math on or off for this channel."""
+    if not AUTO_RENDER:
+        await interaction.response.send_message("Automatic rendering is turned off for this bot (AUTO_RENDER=1).", ephemeral=True)
+        return
+    auto_renderer.set_enabled(interaction.channel_id, enabled)
+    state = "on" if enabled else "off"
+    await interaction.response.send_message(f"Automatic rendering of $...$ math is now {state} in this channel.", ephemeral=True)
+
+@client.tree.command()
+@app_commands.describe(layout="Send one image per equation or stack them into a single image.")
+@app_commands.choices(layout=[
+    app_commands.Choice(name="Separate images", value="separate"),
+    app_commands.Choice(name="Stacked", value="stacked"),
+])
+async def render_batch(interaction: discord.Interaction, layout: str = "separate"):
+    """Render several LaTeX equations at once, one per line."""
+    await interaction.response.send_modal(BatchRenderModal(layout))
+
+@client.tree.context_menu(name="Render Each Line")
+async def render_lines_menu(interaction: discord.Interaction, message: discord.Message):
+    """Render every line of a message as its own equation in a single LaTeX run."""
+    await send_batch(interaction, split_equations(message.content), "stacked")
+
 @client.tree.command()
 @app_commands.describe(equation="Enter the equation in LaTeX format.")
 async def render_ai(interaction: discord.Interaction, equation: str):
     """Render a expression and converts it to LaTeX with AI and then returns it as an image."""
     await interaction.response.defer(ephemeral=False, thinking=True)
     try:
-        response = get_AI_prompt(equation)
-        image_path = visualize_equation(response.text)
-        with open(image_path, 'rb') as image_file:
-            await interaction.followup.send(file=discord.File(image_file, os.path.basename(image_path)))
-        os.remove(image_path)
+        response = await get_AI_latex(equation)
     except RuntimeError as e:
         await interaction.followup.send(f"Error rendering the equation: {e}")
+        return
     except Exception as e:
         await interaction.followup.send("An unexpected error occurred while rendering the equation.")
+        return
+    # The translation has its own cache and concurrency limit, only the render is admitted
+    await send_equation(interaction, response, "render_ai")
 
 @client.tree.context_menu(name="Render with AI")
 async def render_ai(interaction: discord.Interaction, message: discord.Message):
     """Render a expression and converts it to LaTeX with AI and then returns it as an image."""
     await interaction.response.defer(ephemeral=False, thinking=True)
     try:
-        response = get_AI_prompt(message.content.strip())
-        image_path = visualize_equation(response.text)
-        with open(image_path, 'rb') as image_file:
-            await interaction.followup.send(file=discord.File(image_file, os.path.basename(image_path)))
-        os.remove(image_path)
+        response = await get_AI_latex(message.content.strip())
     except RuntimeError as e:
         await interaction.followup.send(f"Error rendering the equation: {e}")
+        return
     except Exception as e:
         await interaction.followup.send("An unexpected error occurred while rendering the equation.")
+        return
+    # The translation has its own cache and concurrency limit, only the render is admitted
+    await send_equation(interaction, response, "render_ai")
 
 @client.tree.command()
-@app_commands.describe(equation="Enter the equation.")
+@app_commands.describe(equation="Enter the equation.", point="Where to take the limit (default 0, use oo for infinity).")
 @app_commands.choices(operation=[
     app_commands.Choice(name="Simplify", value="simplify"),
     app_commands.Choice(name="Factor", value="factor"),
-    # app_commands.Choice(name="Solve", value="solve"),
+    app_commands.Choice(name="Expand", value="expand"),
+    app_commands.Choice(name="Solve", value="solve"),
+    app_commands.Choice(name="Differentiate", value="differentiate"),
+    app_commands.Choice(name="Integrate", value="integrate"),
+    app_commands.Choice(name="Limit", value="limit"),
 ])
-async def math_operation(interaction: discord.Interaction, equation: str, operation: str):
-    """Solve (Temp Unavailable), Simplify, or Solve and Expression or Equation"""
-    await interaction.response.defer(ephemeral=False, thinking=True)
+# sympy runs in its own process and can use its whole time limit
+@admitted("math_operation", cost=2)
+async def math_operation(interaction: discord.Interaction, equation: str, operation: str, point: str = None):
+    """Simplify, Factor, Expand, Solve, Differentiate, Integrate or take a Limit of an Expression or Equation"""
+    if not interaction.response.is_done():
+        await interaction.response.defer(ephemeral=False, thinking=True)
     
-    # Preprocess and validate the equation
+    # Preprocess the equation, then parse it and perform the operation in a sandboxed process
     try:
-        processed_equation = preprocess_expression(equation)
-        expr = sp.sympify(processed_equation)
+        processed_equation = await preprocess_expression(equation)
+        latex_result = await run_symbolic(operation, processed_equation, point)
+    except mathops.ComputationTimeout as e:
+        await interaction.followup.send(str(e))
+        return
     except sp.SympifyError as e:
         await interaction.followup.send(f"Error parsing the equation: {e}")
         return
+    except ValueError as e:
+        await interaction.followup.send(str(e))
+        return
+    except Exception as e:
+        await interaction.followup.send(f"An unexpected error occurred: {e}")
+        return
 
-    # Perform the operation
+    # Send the result back as LaTeX rendered image
     try:
-        if operation == 'simplify':
-            result = sp.simplify(expr)
-        elif operation == 'factor':
-            result = sp.factor(expr)
-        elif operation == 'solve':
-            result = sp.solve(expr, sp.Symbol('x'))
-        else:
-            await interaction.followup.send("Unsupported operation. Please use 'simplify', 'factor', or 'solve'.")
-            return
-
-        # Send the result back as LaTeX rendered image
-        latex_result = sp.latex(result)
-        image_path = visualize_equation(latex_result)
-        with open(image_path, 'rb') as image_file:
-            await interaction.followup.send(file=discord.File(image_file, os.path.basename(image_path)))
-        os.remove(image_path)
+        png = await render_equation_shared(latex_result)
+        await send_png(interaction, png, image_filename('equation'))
     except Exception as e:
         await interaction.followup.send(f"An unexpected error occurred: {e}")
 
 @client.tree.command()
-@app_commands.describe(expression="Enter the function expression, like 'x^2 - 3*x + 5'.")
-async def plot(interaction: discord.Interaction, expression: str):
+@app_commands.describe(
+    expression="Enter the function expression, like 'x^2 - 3*x + 5'. Separate several functions with ';'.",
+    x_min="Left end of the x axis (default -10).",
+    x_max="Right end of the x axis (default 10).",
+)
+async def plot(interaction: discord.Interaction, expression: str, x_min: float = -10.0, x_max: float = 10.0):
     """Plot a mathematical function based on the given expression."""
     await interaction.response.defer(ephemeral=False, thinking=True)
     
-    image_path, error = plot_function(expression)
+    try:
+        expressions = await prepare_plot_expressions(expression)
+        # Only a plot that isn't in the memory cache is admitted as a job
+        png = render_cache.peek(plot_key(expressions, x_min, x_max))
+        if png is not None:
+            error = None
+        else:
+            ticket = await admit(interaction, "plot")
+            if ticket is None:
+                return
+            async with ticket:
+                png, error = await plot_function_shared(expressions, x_min, x_max)
+    except Exception as e:
+        png, error = None, str(e)
     if error:
         await interaction.followup.send(f"An error occurred while plotting the function: {error}")
     else:
-        # Create the button view with the expression
-        view = MetaCalculatorButton(expression)
-        with open(image_path, 'rb') as image_file:
-            # Send the image along with the button view
-            await interaction.followup.send(file=discord.File(image_file, os.path.basename(image_path)), view=view)
-        os.remove(image_path)
+        # Create the button view with the (first) expression
+        view = MetaCalculatorButton(plotting.split_expressions(expression)[0])
+        # Send the image along with the button view
+        await send_png(interaction, png, 'plot.png', view=view)
 
 
 @client.tree.command()
@@ -559,10 +1416,34 @@ async def latex_help(interaction: discord.Interaction):
     await interaction.response.send_message(HELP_TEXT, ephemeral=True)
 
 @client.tree.command()
-@app_commands.describe(rows="Number of rows for the table.")
-async def input_table(interaction: discord.Interaction, rows: int):
-    """Create a table of input buttons and submit to plot."""
-    await interaction.response.send_message(view=TableInputView(rows), ephemeral=True)
+@app_commands.describe(
+    rows="Number of rows for a table of input buttons. Leave empty to paste data instead.",
+    file="A CSV or TSV file of x,y pairs to plot.",
+    degree="Degree of the polynomial fit.",
+)
+async def input_table(interaction: discord.Interaction, rows: app_commands.Range[int, 1, 12] = None, file: discord.Attachment = None, degree: app_commands.Range[int, 2, 6] = 2):
+    """Create a table of input buttons, or paste or upload data, and plot it."""
+    if file is not None:
+        if file.size > datasets.MAX_FILE_BYTES:
+            await interaction.response.send_message(f"Please upload at most {datasets.MAX_FILE_BYTES // 1024} KB of data.", ephemeral=True)
+            return
+        # Downloading can take a while, so this one defers first
+        await interaction.response.defer(thinking=True)
+        try:
+            text = datasets.decode_upload(await file.read())
+        except (ValueError, discord.HTTPException) as e:
+            await send_private_error(interaction, f"Could not read the file: {e}")
+            return
+        await plot_dataset(interaction, text, degree)
+        return
+    if rows is None:
+        # A whole dataset in one interaction instead of one modal per cell
+        await interaction.response.send_modal(DataModal(degree))
+        return
+
+    session = TableSession.empty(rows, degree)
+    await interaction.response.send_message(view=table_components(session), ephemeral=True)
+    sessions.put((await interaction.original_response()).id, session)
 
 @client.tree.command()
 @app_commands.describe(shape="The shape to draw", side1="Length of the first side or radius")
@@ -576,58 +1457,66 @@ async def input_table(interaction: discord.Interaction, rows: int):
                        side3="Length of the third side (only for triangle)")
 async def draw(interaction: discord.Interaction, shape: str, side1: float, side2: float = None, side3: float = None):
     """Draws a specified shape with given dimensions."""
-    buffer = BytesIO()
-    
-    plt.figure()
-    if shape == "triangle" and side1 and side2 and side3:
-        plot_triangle(side1, side2, side3)
-    elif shape == "circle" and side1:
-        plot_circle(side1)
-    elif shape == "rectangle" and side1 and side2:
-        plot_rectangle(side1, side2)
-    elif shape == "square" and side1:
-        plot_square(side1)
-    else:
-        await interaction.response.send_message("Invalid or incomplete dimensions for the selected shape.", ephemeral=True)
+    # Impossible shapes are refused before anything is queued or drawn
+    try:
+        measured = geometry.canonicalize(shape, side1, side2, side3)
+    except geometry.ShapeError as e:
+        await interaction.response.send_message(str(e), ephemeral=True)
         return
 
-    plt.savefig(buffer, format='png')
-    buffer.seek(0)
-    plt.close()
+    await interaction.response.defer(thinking=True)
+    try:
+        png = await run_draw_shape(shape, side1, side2, side3)
+    except RuntimeError as e:
+        await interaction.followup.send(f"Error drawing the shape: {e}")
+        return
 
-    file = discord.File(buffer, filename='shape.png')
-    await interaction.response.send_message(file=file)
+    await send_png(interaction, png, 'shape.png', content=measured.summary())
 
 @client.tree.command()
-@app_commands.choices(topic=[
-    app_commands.Choice(name="Algebra 1", value="Algebra 1"),
-    app_commands.Choice(name="Algebra 2", value="Algebra 2"),
-    app_commands.Choice(name="Geometry", value="Geometry"),
-    app_commands.Choice(name="Statistics", value="Statistics"),
-    app_commands.Choice(name="Calculus", value="Calculus")
-])
 @app_commands.describe(number_of_questions="Number of questions in the Quiz")
 @app_commands.describe(topic="Topic that will be covered in the quiz")
-async def start_quiz(interaction: discord.Interaction, number_of_questions: app_commands.Range[int, 1, 5], topic: str):
+@app_commands.describe(difficulty="Only ask questions of this difficulty")
+async def start_quiz(interaction: discord.Interaction, number_of_questions: app_commands.Range[int, 1, 5], topic: str, difficulty: str = None):
     """Creates a math quiz to test your knowledge on a topic"""
-    if topic not in questions:
+    topic_questions = question_store.quiz_questions(topic, difficulty)
+    if not topic_questions:
         await interaction.response.send_message("Topic not found!", ephemeral=True)
         return
 
-    selected_questions = random.sample(questions[topic], min(number_of_questions, len(questions[topic])))
-    view = MathQuizView(selected_questions)
-    await interaction.response.send_message(content=f"{view.current_question['question']}", view=view)
+    selected_questions = random.sample(topic_questions, min(number_of_questions, len(topic_questions)))
+    session = QuizSession(selected_questions)
+    await interaction.response.send_message(content=f"{session.current_question['question']}", view=quiz_components(session))
+    sessions.put((await interaction.original_response()).id, session)
+
+@start_quiz.autocomplete('topic')
+async def start_quiz_topic_autocomplete(interaction: discord.Interaction, current: str):
+    # Topics come from the question bank so new ones show up without a restart
+    return [
+        app_commands.Choice(name=topic, value=topic)
+        for topic in question_store.topics() if current.lower() in topic.lower()
+    ][:25]
+
+@start_quiz.autocomplete('difficulty')
+async def start_quiz_difficulty_autocomplete(interaction: discord.Interaction, current: str):
+    return [
+        app_commands.Choice(name=difficulty.title(), value=difficulty)
+        for difficulty in question_store.difficulties() if current.lower() in difficulty
+    ][:25]
 
 group = app_commands.Group(name="qotd", description="Math Problem of the Day'")
 
 @group.command(name="view")
 async def qotd_view(interaction: discord.Interaction):
     """Displays the question of the day."""
+    await interaction.response.defer(ephemeral=True, thinking=True)
     question_data = get_qotd_data()
-    image_path = visualize_equation(question_data['question'])
-    file = discord.File(image_path, filename='qotd.png')
-    await interaction.response.send_message(file=file, ephemeral=True)
-    os.remove(image_path)
+    try:
+        png = await get_qotd_image(time.strftime("%Y-%m-%d"), question_data['question'])
+    except RuntimeError as e:
+        await interaction.followup.send(f"Error rendering the question: {e}", ephemeral=True)
+        return
+    await send_png(interaction, png, image_filename('qotd'), ephemeral=True)
 
 @group.command(name="answer")
 async def qotd_answer(interaction: discord.Interaction, answer: str):
@@ -640,22 +1529,29 @@ async def qotd_answer(interaction: discord.Interaction, answer: str):
     await interaction.response.send_message(response, ephemeral=True)
 
 @group.command(name="previous")
-@app_commands.choices(date=[
-    app_commands.Choice(name="May 1, 2024", value="2024-05-01"),
-    app_commands.Choice(name="May 10, 2024", value="2024-05-10"),
-])
+@app_commands.describe(date="Date of the question (YYYY-MM-DD)")
 async def qotd_previous(interaction: discord.Interaction, date: str):
     """Shows a previous question based on the input date."""
-    with open('bot/qotd.json', 'r') as f:
-        qotd_questions = json.load(f)
-    if date in qotd_questions:
-        image_path = visualize_equation(qotd_questions[date]['question'])
-        file = discord.File(image_path, filename='qotd.png')
-        await interaction.response.send_message(content=f"**Answer:** {qotd_questions[date]['answer']}", file=file, ephemeral=True)
-        os.remove(image_path)
+    question_data = question_store.qotd(date)
+    # Only past questions, so answers to upcoming ones don't leak
+    if question_data and date <= time.strftime("%Y-%m-%d"):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            png = await get_qotd_image(date, question_data['question'])
+        except RuntimeError as e:
+            await interaction.followup.send(f"Error rendering the question: {e}", ephemeral=True)
+            return
+        await send_png(interaction, png, image_filename('qotd'), content=f"**Answer:** {question_data['answer']}", ephemeral=True)
     else:
         await interaction.response.send_message("No question found for that date.", ephemeral=True)
 
+@qotd_previous.autocomplete('date')
+async def qotd_previous_autocomplete(interaction: discord.Interaction, current: str):
+    return [
+        app_commands.Choice(name=format_date(date), value=date)
+        for date in question_store.past_qotd_dates(current)
+    ]
+
 @group.command(name="hint")
 async def qotd_hint(interaction: discord.Interaction):
     """Provides a hint for the current day's question."""
@@ -665,4 +1561,7 @@ async def qotd_hint(interaction: discord.Interaction):
 client.tree.add_command(group, guild=discord.Object(id=GUILD_ID))
 
 # Run the client with the bot token
-client.run(TOKEN)
\ No newline at end of file
+if __name__ == "__main__":
+    client.run(TOKEN)
+    executor.shutdown()
+    tex_pool.close()
@@ -0,0 +1,68 @@
+"""
+x/y data pasted or uploaded to /input_table.
+
+Accepts CSV, TSV, semicolon or whitespace separated text with an optional
+header row. Two or more columns are read as x and y; a single column is read
+as y against 1, 2, 3, ... The text is parsed once, straight into float arrays.
+"""
+import numpy as np
+
+MAX_POINTS = 50000
+# Uploaded files bigger than this are refused before they are downloaded
+MAX_FILE_BYTES = 2 * 1024 * 1024
+
+_DELIMITERS = ("\t", ",", ";")
+
+
+def _delimiter(line: str):
+    for delimiter in _DELIMITERS:
+        if delimiter in line:
+            return delimiter
+    # Runs of spaces
+    return None
+
+
+def _is_numeric(fields) -> bool:
+    try:
+        for field in fields:
+            float(field)
+    except ValueError:
+        return False
+    return True
+
+
+def parse_points(text: str, max_points=MAX_POINTS):
+    """Parse delimited text into (x, y) float arrays. Raises ValueError with a readable message."""
+    lines = [line.strip() for line in text.splitlines()]
+    lines = [line for line in lines if line and not line.startswith("#")]
+    if not lines:
+        raise ValueError("No data found.")
+    delimiter = _delimiter(lines[0])
+    if not _is_numeric(field.strip() for field in lines[0].split(delimiter)[:2]):
+        # Header row
+        lines = lines[1:]
+    if not lines:
+        raise ValueError("No data rows found below the header.")
+    if len(lines) > max_points:
+        raise ValueError(f"Please send at most {max_points} points, got {len(lines)}.")
+
+    columns = (0, 1) if len(lines[0].split(delimiter)) > 1 else (0,)
+    try:
+        data = np.loadtxt(lines, delimiter=delimiter, usecols=columns, ndmin=2, dtype=float)
+    except ValueError as e:
+        raise ValueError(f"Could not read the data: {e}") from None
+    if not np.isfinite(data).all():
+        raise ValueError("The data contains values that are not finite numbers.")
+
+    if data.shape[1] == 1:
+        return np.arange(1, len(data) + 1, dtype=float), data[:, 0].copy()
+    return data[:, 0].copy(), data[:, 1].copy()
+
+
+def decode_upload(content: bytes) -> str:
+    """Text of an uploaded data file."""
+    try:
+        # utf-8-sig drops the byte order mark spreadsheet exports often start with
+        return content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("The file must be UTF-8 text (CSV or TSV).") from None
@@ -0,0 +1,67 @@
+"""
+Executor layer that keeps heavy work off the discord.py event loop.
+
+Jobs that mostly wait on a subprocess (pdflatex, pdftoppm, the sympy
+sandboxes in mathops.py) or hold matplotlib go to a thread pool with a
+bounded queue and a per-job timeout.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(RuntimeError):
+    """Raised when too many jobs are already waiting."""
+
+
+class JobTimeoutError(RuntimeError):
+    """Raised when a job takes longer than its timeout."""
+
+
+class JobExecutor:
+    """Runs blocking jobs on a worker pool with a bounded queue and timeouts."""
+
+    def __init__(self, io_workers=4, max_pending=32, timeout=60.0):
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="render")
+
+    async def run_io(self, fn, *args, timeout=None, **kwargs):
+        """Run a function in the thread pool."""
+        return await self._submit(self._io_pool, fn, args, kwargs, timeout)
+
+    async def _submit(self, pool, fn, args, kwargs, timeout):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise QueueFullError("The bot is busy right now, please try again in a moment.")
+            self.pending += 1
+
+        try:
+            job = pool.submit(fn, *args, **kwargs)
+        except RuntimeError:
+            # The pool is shutting down
+            self._finished(None)
+            raise
+        # A job that timed out keeps its thread busy, so it counts as pending until it really ends
+        job.add_done_callback(self._finished)
+        try:
+            # Cancelling the awaiting task (or timing out) cancels the job if it
+            # has not started yet; a job that is already running is left to finish.
+            return await asyncio.wait_for(asyncio.wrap_future(job), timeout or self.timeout)
+        except asyncio.TimeoutError as e:
+            self.timeouts += 1
+            raise JobTimeoutError("This took too long and was cancelled.") from e
+
+    def _finished(self, job):
+        # Runs on the worker thread that finished the job
+        with self._lock:
+            self.pending -= 1
+
+    def shutdown(self):
+        """Cancel queued jobs and stop the pool."""
+        self._io_pool.shutdown(wait=False, cancel_futures=True)
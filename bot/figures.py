@@ -0,0 +1,50 @@
+"""
+Thread-safe matplotlib rendering without pyplot.
+
+pyplot keeps one global "current figure", so two threads drawing at once
+clobber each other and forgotten figures leak. Figures here are plain Agg
+Figure objects borrowed from a small pool, drawn on by exactly one job and
+cleared before they are reused.
+"""
+import queue
+from contextlib import contextmanager
+
+from render_io import figure_to_png
+
+
+class FigurePool:
+    """A pool of reusable Agg figures."""
+
+    def __init__(self, size=4):
+        self.size = size
+        self.created = 0
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    @contextmanager
+    def figure(self, figsize=(8, 6)):
+        """Borrow a blank figure of the given size for the duration of the block."""
+        try:
+            fig = self._idle.get_nowait()
+        except queue.Empty:
+            # matplotlib is only imported once the first figure is needed
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+            fig = Figure()
+            FigureCanvasAgg(fig)
+            self.created += 1
+        fig.set_size_inches(figsize)
+        try:
+            yield fig
+        finally:
+            fig.clear()
+            try:
+                self._idle.put_nowait(fig)
+            except queue.Full:
+                # Extra figures made under load are simply dropped
+                pass
+
+    def render(self, draw, figsize=(8, 6), **savefig_kwargs) -> bytes:
+        """Call draw(fig) on a pooled figure and return the result as PNG bytes."""
+        with self.figure(figsize) as fig:
+            draw(fig)
+            return figure_to_png(fig, **savefig_kwargs)
@@ -0,0 +1,105 @@
+"""
+Shape geometry for /draw, computed analytically and without matplotlib.
+
+Parameters are validated and put in canonical form before anything is drawn:
+triangle sides are sorted, rectangles are stored landscape. Vertices are
+scaled so the longest side is 1, so the picture only depends on the shape's
+proportions and its labels. Shapes that would look the same share one
+cache key.
+"""
+import math
+
+SHAPES = ("triangle", "circle", "rectangle", "square")
+# Relative slack for triangles that are degenerate only through rounding
+TOLERANCE = 1e-9
+
+
+class ShapeError(ValueError):
+    """Raised for dimensions that don't describe a drawable shape."""
+
+
+def fmt(value: float) -> str:
+    """Numbers as they appear on labels; equal labels mean an equal picture."""
+    return f"{value:.4g}"
+
+
+class Shape:
+    __slots__ = ("kind", "sides", "vertices", "angles", "area", "perimeter", "extra")
+
+    def __init__(self, kind, sides, vertices, angles, area, perimeter, extra=None):
+        self.kind = kind
+        # Canonical dimensions: sorted triangle sides, (width, height), (side,) or (radius,)
+        self.sides = sides
+        # Polygon corners scaled to a longest side of 1; empty for a circle
+        self.vertices = vertices
+        # Interior angles in degrees, one per vertex
+        self.angles = angles
+        self.area = area
+        self.perimeter = perimeter
+        # Other measures worth printing, e.g. the diagonal
+        self.extra = extra or {}
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.kind}:" + ",".join(fmt(side) for side in self.sides)
+
+    def summary(self) -> str:
+        perimeter = "Circumference" if self.kind == "circle" else "Perimeter"
+        parts = [f"Area: {fmt(self.area)}", f"{perimeter}: {fmt(self.perimeter)}"]
+        parts += [f"{name}: {fmt(value)}" for name, value in self.extra.items()]
+        if self.kind == "triangle":
+            parts.append("Angles: " + ", ".join(f"{fmt(angle)}°" for angle in self.angles))
+        return " | ".join(parts)
+
+
+def _dimension(value, name):
+    if value is None:
+        raise ShapeError(f"Please give the {name}.")
+    value = float(value)
+    if not math.isfinite(value) or value <= 0:
+        raise ShapeError(f"The {name} must be a positive number.")
+    return value
+
+
+def _triangle(a, b, c):
+    a, b, c = sorted((a, b, c), reverse=True)
+    if b + c <= a * (1 + TOLERANCE):
+        raise ShapeError(f"Sides {fmt(a)}, {fmt(b)} and {fmt(c)} can't form a triangle: {fmt(b)} + {fmt(c)} is not more than {fmt(a)}.")
+    # Heron's formula in the form that stays accurate for needle-like triangles
+    area = math.sqrt((a + (b + c)) * (c - (a - b)) * (c + (a - b)) * (a + (b - c))) / 4
+
+    def angle(opposite, side1, side2):
+        cosine = (side1 ** 2 + side2 ** 2 - opposite ** 2) / (2 * side1 * side2)
+        return math.degrees(math.acos(max(-1.0, min(1.0, cosine))))
+
+    # The longest side lies along the x axis from (0, 0) to (1, 0); the third
+    # corner is where sides b and c meet above it
+    gamma = math.radians(angle(c, a, b))
+    apex = (1 - b * math.cos(gamma) / a, b * math.sin(gamma) / a)
+    vertices = ((0.0, 0.0), (1.0, 0.0), apex)
+    # Angle at each vertex in the same order: opposite b, opposite c, opposite a
+    angles = (angle(b, a, c), angle(c, a, b), angle(a, b, c))
+    return Shape("triangle", (a, b, c), vertices, angles, area, a + b + c)
+
+
+def _rectangle(width, height, kind="rectangle"):
+    width, height = max(width, height), min(width, height)
+    ratio = height / width
+    vertices = ((0.0, 0.0), (1.0, 0.0), (1.0, ratio), (0.0, ratio))
+    sides = (width,) if kind == "square" else (width, height)
+    return Shape(kind, sides, vertices, (90.0,) * 4, width * height, 2 * (width + height), {"Diagonal": math.hypot(width, height)})
+
+
+def canonicalize(shape, side1, side2=None, side3=None) -> Shape:
+    """Validate the dimensions of a shape and return its canonical geometry, or raise ShapeError."""
+    if shape == "triangle":
+        return _triangle(_dimension(side1, "first side"), _dimension(side2, "second side"), _dimension(side3, "third side"))
+    if shape == "rectangle":
+        return _rectangle(_dimension(side1, "width"), _dimension(side2, "height"))
+    if shape == "square":
+        side = _dimension(side1, "side length")
+        return _rectangle(side, side, "square")
+    if shape == "circle":
+        radius = _dimension(side1, "radius")
+        return Shape("circle", (radius,), (), (), math.pi * radius ** 2, 2 * math.pi * radius, {"Diameter": 2 * radius})
+    raise ShapeError(f"Unknown shape {shape!r}.")
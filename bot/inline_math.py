@@ -0,0 +1,181 @@
+"""
+Automatic rendering of inline math in channel messages.
+
+In channels that opted in, $...$, $$...$$, \\(...\\) and \\[...\\] segments of
+new and edited messages are rendered into one reply per message. Bursts of
+edits are debounced per message and updates are rate-limited per channel, so
+someone editing a long derivation causes a few renders, not one per
+keystroke. The reply itself is kept up to date by the bot (see
+update_inline_math in bot.py), re-rendering only the segments that changed.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from collections import OrderedDict, deque
+
+# Discord allows 10 attachments per message
+MAX_SEGMENTS = 10
+MAX_SEGMENT_LENGTH = 1000
+
+_CODE = re.compile(r"```.*?```|`[^`\n]*`", re.DOTALL)
+_MATH = re.compile(
+    r"\$\$(?P<display>.+?)\$\$"
+    r"|\\\[(?P<bracket>.+?)\\\]"
+    r"|\\\((?P<paren>.+?)\\\)"
+    # No space just inside the dollars and no digit right after, so "$5 and $10" is not math
+    r"|(?<![\\$])\$(?P<inline>[^\s$](?:[^$\n]*?[^\s\\$])?)\$(?!\d)",
+    re.DOTALL,
+)
+
+
+def find_segments(text: str):
+    """The distinct math segments of a message, in order, outside code blocks."""
+    segments = []
+    for match in _MATH.finditer(_CODE.sub(" ", text)):
+        segment = next(group for group in match.groups() if group is not None).strip()
+        if segment and len(segment) <= MAX_SEGMENT_LENGTH and segment not in segments:
+            segments.append(segment)
+    return segments[:MAX_SEGMENTS]
+
+
+class ChannelLimiter:
+    """Allows at most `rate` updates per `per` seconds in each channel."""
+
+    def __init__(self, rate=5, per=10.0):
+        self.rate = rate
+        self.per = per
+        self._recent = {}
+
+    def reserve(self, channel_id) -> float:
+        """Take a slot and return 0, or return the seconds until one frees up."""
+        now = time.monotonic()
+        recent = self._recent.setdefault(channel_id, deque())
+        while recent and recent[0] <= now - self.per:
+            recent.popleft()
+        if len(recent) >= self.rate:
+            return recent[0] + self.per - now
+        recent.append(now)
+        return 0.0
+
+
+class TrackedMessage:
+    __slots__ = ("channel_id", "guild_id", "author_id", "content", "rendered", "reply", "timer", "running")
+
+    def __init__(self, channel_id, guild_id=None, author_id=None):
+        self.channel_id = channel_id
+        # Who the renders are charged to under admission control
+        self.guild_id = guild_id
+        self.author_id = author_id
+        self.content = ""
+        # Content the reply currently shows
+        self.rendered = None
+        self.reply = None
+        self.timer = None
+        self.running = False
+
+
+class AutoRenderer:
+    """Tracks messages in opted-in channels and calls update(message_id, tracked, content) once their edits settle."""
+
+    def __init__(self, update, debounce=1.5, rate=5, per=10.0, max_tracked=1000, path="bot/tmp/auto_render.json"):
+        self.update = update
+        self.debounce = debounce
+        self.limiter = ChannelLimiter(rate, per)
+        self.max_tracked = max_tracked
+        self.path = path
+        self.updates = 0
+        self.debounced = 0
+        self.rate_limited = 0
+        self.channels = set()
+        self._messages = OrderedDict()
+        self._tasks = set()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.channels = set(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Could not load auto-render channels: {e}")
+
+    def enabled(self, channel_id) -> bool:
+        return channel_id in self.channels
+
+    def set_enabled(self, channel_id, enabled: bool):
+        if enabled:
+            self.channels.add(channel_id)
+        else:
+            self.channels.discard(channel_id)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(sorted(self.channels), f)
+
+    def feed(self, message_id, channel_id, content: str, guild_id=None, author_id=None):
+        """Record the latest content of a message and (re)start its debounce timer."""
+        tracked = self._messages.get(message_id)
+        if tracked is None:
+            if not find_segments(content):
+                # Nothing to render and no reply to update
+                return
+            tracked = self._messages[message_id] = TrackedMessage(channel_id, guild_id, author_id)
+            while len(self._messages) > self.max_tracked:
+                _, dropped = self._messages.popitem(last=False)
+                if dropped.timer:
+                    dropped.timer.cancel()
+        self._messages.move_to_end(message_id)
+        tracked.content = content
+        if tracked.timer:
+            tracked.timer.cancel()
+            self.debounced += 1
+        self._schedule(message_id, tracked, self.debounce)
+
+    def forget(self, message_id):
+        """Stop tracking a message and return its state, e.g. once it was deleted."""
+        tracked = self._messages.pop(message_id, None)
+        if tracked and tracked.timer:
+            tracked.timer.cancel()
+        return tracked
+
+    def _schedule(self, message_id, tracked, delay):
+        tracked.timer = asyncio.get_running_loop().call_later(delay, self._fire, message_id, tracked)
+
+    def _fire(self, message_id, tracked):
+        tracked.timer = None
+        if tracked.running or tracked.content == tracked.rendered:
+            # A running update reschedules itself if the content moved on meanwhile
+            return
+        wait = self.limiter.reserve(tracked.channel_id)
+        if wait:
+            self.rate_limited += 1
+            self._schedule(message_id, tracked, wait)
+            return
+        task = asyncio.get_running_loop().create_task(self._run(message_id, tracked))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, message_id, tracked):
+        tracked.running = True
+        content = tracked.content
+        try:
+            await self.update(message_id, tracked, content)
+            self.updates += 1
+        except Exception as e:
+            print(f"Could not update the inline math reply to {message_id}: {e!r}")
+        finally:
+            tracked.running = False
+            tracked.rendered = content
+        if tracked.content != content and tracked.timer is None and self._messages.get(message_id) is tracked:
+            self._schedule(message_id, tracked, self.debounce)
+
+    def stats(self):
+        return {
+            "channels": len(self.channels),
+            "tracked": len(self._messages),
+            "updates": self.updates,
+            "debounced": self.debounced,
+            "rate_limited": self.rate_limited,
+        }
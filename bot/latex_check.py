@@ -0,0 +1,232 @@
+"""
+Checks LaTeX input before it reaches pdflatex.
+
+Equations are typeset inside \\[...\\], so anything that can't work there
+is refused up front: unbalanced braces, \\left/\\right and environments,
+stray $, % and # characters, and commands that aren't known math macros.
+Primitives that read or write files, define macros or otherwise reach
+outside the equation are never allowed. The check is a single pass over
+the input with one regular expression and takes microseconds, so bad input
+gets a precise message instead of a wasted compile.
+"""
+import re
+
+# Defaults for the size limits, overridable per call
+MAX_LENGTH = 4000
+MAX_DEPTH = 32
+
+_TOKEN = re.compile(
+    r"\\(?P<env>begin|end)\s*\{(?P<name>[^{}]*)\}"
+    r"|\\(?P<command>[A-Za-z]+|.|\Z)"
+    r"|(?P<char>\^\^|[{}$%#&])",
+    re.DOTALL,
+)
+# What follows \left, \middle or \right
+_DELIMITER = re.compile(r"\s*(\\[A-Za-z]+|\\.|[^\s\\{}])?", re.DOTALL)
+
+# Math macros of LaTeX, amsmath and amssymb, the packages every preamble loads
+KNOWN_COMMANDS = set("""
+    alpha beta gamma delta epsilon varepsilon zeta eta theta vartheta iota kappa varkappa
+    lambda mu nu xi pi varpi rho varrho sigma varsigma tau upsilon phi varphi chi psi omega
+    digamma Gamma Delta Theta Lambda Xi Pi Sigma Upsilon Phi Psi Omega
+    varGamma varDelta varTheta varLambda varXi varPi varSigma varUpsilon varPhi varPsi varOmega
+    aleph beth gimel daleth
+
+    infty nabla partial forall exists nexists emptyset varnothing neg lnot top bot angle
+    measuredangle sphericalangle triangle backslash prime hbar hslash ell wp Re Im imath jmath
+    surd flat natural sharp clubsuit diamondsuit heartsuit spadesuit Box square blacksquare
+    checkmark therefore because complement mho eth Finv Game S P dag ddag
+    dots ldots cdots vdots ddots dotsc dotsb dotsm dotsi dotso colon cdotp ldotp
+
+    pm mp times div cdot ast star circ bullet oplus ominus otimes oslash odot cap cup sqcap sqcup
+    vee wedge lor land setminus smallsetminus uplus amalg wr diamond bigtriangleup
+    bigtriangledown triangleleft triangleright lhd rhd unlhd unrhd dagger ddagger dotplus
+    ltimes rtimes barwedge veebar boxplus boxminus boxtimes boxdot centerdot intercal
+
+    leq le geq ge neq ne equiv sim simeq approx cong propto prec succ preceq succeq ll gg lll ggg
+    subset supset subseteq supseteq subsetneq supsetneq sqsubset sqsupset sqsubseteq sqsupseteq
+    in ni notin owns vdash dashv vDash Vdash models perp mid nmid parallel nparallel asymp bowtie
+    doteq doteqdot smile frown leqslant geqslant lesssim gtrsim approxeq thicksim thickapprox
+    nleq ngeq nless ngtr lneq gneq ncong nsim nsubseteq nsupseteq varpropto triangleq circeq
+    eqcirc risingdotseq fallingdotseq lessgtr gtrless not
+
+    leftarrow gets rightarrow to Leftarrow Rightarrow leftrightarrow Leftrightarrow
+    longleftarrow longrightarrow Longleftarrow Longrightarrow longleftrightarrow
+    Longleftrightarrow mapsto longmapsto uparrow downarrow Uparrow Downarrow updownarrow
+    Updownarrow nearrow searrow swarrow nwarrow hookleftarrow hookrightarrow leftharpoonup
+    leftharpoondown rightharpoonup rightharpoondown rightleftharpoons leftrightharpoons iff
+    implies impliedby leadsto rightsquigarrow circlearrowleft circlearrowright curvearrowleft
+    curvearrowright twoheadrightarrow twoheadleftarrow rightrightarrows leftleftarrows
+    nrightarrow nleftarrow nRightarrow nLeftarrow nleftrightarrow nLeftrightarrow
+    xrightarrow xleftarrow
+
+    sum prod coprod int iint iiint iiiint idotsint oint bigcup bigcap bigsqcup bigvee bigwedge
+    bigoplus bigotimes bigodot biguplus
+
+    arccos arcsin arctan arg cos cosh cot coth csc deg det dim exp gcd hom inf ker lg lim
+    liminf limsup ln log max min Pr sec sin sinh sup tan tanh varliminf varlimsup injlim projlim
+    operatorname pmod bmod mod pod
+
+    langle rangle lfloor rfloor lceil rceil lvert rvert lVert rVert vert Vert lbrace rbrace
+    lbrack rbrack ulcorner urcorner llcorner lrcorner lgroup rgroup lmoustache rmoustache
+    left middle right big Big bigg Bigg bigl bigr Bigl Bigr biggl biggr Biggl Biggr
+    bigm Bigm biggm Biggm
+
+    hat widehat tilde widetilde bar overline vec overrightarrow overleftarrow
+    overleftrightarrow dot ddot dddot ddddot acute grave breve check mathring underline
+    underrightarrow underleftarrow underleftrightarrow overbrace underbrace
+
+    frac dfrac tfrac cfrac genfrac binom dbinom tbinom sqrt over atop choose
+    overset underset stackrel substack sideset boxed limits nolimits
+    displaystyle textstyle scriptstyle scriptscriptstyle
+    mathop mathbin mathrel mathord mathopen mathclose mathpunct mathinner
+    phantom vphantom hphantom smash mathstrut tag notag nonumber hline
+
+    quad qquad enspace thinspace medspace thickspace negthinspace negmedspace
+    negthickspace hspace
+
+    text textrm textbf textit textsf texttt textnormal textup mbox
+    mathrm mathit mathbf mathsf mathtt mathcal mathbb mathfrak mathnormal boldsymbol pmb
+    rm it bf cal sf tt
+""".split())
+
+# Single character escapes such as "\{", "\," or "\\"
+KNOWN_ESCAPES = set("{}|,;:!>%#&$_ \\\n\t")
+
+ENVIRONMENTS = {
+    "matrix", "pmatrix", "bmatrix", "Bmatrix", "vmatrix", "Vmatrix", "smallmatrix",
+    "cases", "aligned", "alignedat", "gathered", "split", "array", "subarray",
+}
+# Display environments that can't go inside \[...\], with what to use instead
+_DISPLAY_ENVIRONMENTS = {
+    "align": "aligned", "align*": "aligned", "alignat": "alignedat", "alignat*": "alignedat",
+    "gather": "gathered", "gather*": "gathered", "eqnarray": "aligned", "eqnarray*": "aligned",
+    "equation": None, "equation*": None, "multline": None, "multline*": None, "displaymath": None,
+}
+
+# Primitives that touch files, run programs, redefine things or loop
+FORBIDDEN_COMMANDS = set("""
+    input include includeonly InputIfFileExists write immediate openout openin closeout closein
+    read readline special directlua latelua pdfprimitive shipout end bye dump
+    def edef gdef xdef let futurelet newcommand renewcommand providecommand newenvironment
+    renewenvironment DeclareMathOperator catcode lccode uccode sfcode mathcode delcode
+    csname endcsname expandafter afterassignment aftergroup loop repeat iterate
+    usepackage RequirePackage documentclass output everypar everymath everydisplay everyjob
+    everyhbox everyvbox everycr jobname batchmode errorstopmode scrollmode nonstopmode
+    errmessage message typeout show showbox showthe showlists uppercase lowercase
+    string detokenize scantokens unexpanded noexpand the count countdef dimen dimendef skip
+    toks toksdef chardef mathchardef newcount newtoks newif
+""".split())
+
+
+class LatexError(RuntimeError):
+    """Raised for input that can't be typeset; the message says what and where."""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        # Short category for metrics, e.g. "unbalanced" or "unknown_command"
+        self.reason = reason
+
+
+def _opener(entry) -> str:
+    kind, name, position = entry
+    if kind == "{":
+        return f"The {{ at character {position}"
+    if kind == "left":
+        return f"`\\left` at character {position}"
+    return f"`\\begin{{{name}}}` at character {position}"
+
+
+def _closer(entry) -> str:
+    kind, name, _ = entry
+    return {"{": "}", "left": "`\\right`"}.get(kind, f"`\\end{{{name}}}`")
+
+
+def check_latex(equation: str, max_length=MAX_LENGTH, max_depth=MAX_DEPTH):
+    """Raise LatexError if an equation can't be typeset inside \\[...\\]."""
+    if not equation.strip():
+        raise LatexError("The equation is empty.", "empty")
+    if len(equation) > max_length:
+        raise LatexError(f"The equation is {len(equation)} characters long, the limit is {max_length}.", "length")
+
+    # Open groups, innermost last: ("{", None, position), ("left", None, position) or ("env", name, position)
+    stack = []
+    position = 0
+    while True:
+        match = _TOKEN.search(equation, position)
+        if match is None:
+            break
+        position = match.end()
+        at = match.start() + 1
+
+        if match.group("env"):
+            name = match.group("name").strip()
+            if match.group("env") == "begin":
+                if name not in ENVIRONMENTS:
+                    if name in _DISPLAY_ENVIRONMENTS:
+                        instead = _DISPLAY_ENVIRONMENTS[name]
+                        hint = f" use {{{instead}}} instead" if instead else " leave it out"
+                        raise LatexError(f"The equation is already displayed, so {{{name}}} can't be used at character {at};{hint}.", "environment")
+                    raise LatexError(f"Unknown environment {{{name}}} at character {at}.", "environment")
+                stack.append(("env", name, at))
+            elif not stack or stack[-1][0] != "env" or stack[-1][1] != name:
+                expected = f", expected {_closer(stack[-1])}" if stack else ""
+                raise LatexError(f"`\\end{{{name}}}` at character {at} has no matching `\\begin{{{name}}}`{expected}.", "unbalanced")
+            else:
+                stack.pop()
+
+        elif match.group("command") is not None:
+            name = match.group("command")
+            if not name:
+                raise LatexError("The equation ends with a lone backslash.", "syntax")
+            if name in ("begin", "end"):
+                raise LatexError(f"`\\{name}` at character {at} needs an environment name in braces.", "syntax")
+            if name in FORBIDDEN_COMMANDS:
+                raise LatexError(f"`\\{name}` is not allowed (character {at}).", "forbidden")
+            if name.isalpha():
+                if name not in KNOWN_COMMANDS:
+                    raise LatexError(f"Unknown command `\\{name}` at character {at}.", "unknown_command")
+            elif name not in KNOWN_ESCAPES:
+                raise LatexError(f"Unknown command `\\{name}` at character {at}.", "unknown_command")
+
+            if name in ("left", "middle", "right"):
+                delimiter = _DELIMITER.match(equation, position)
+                if delimiter.group(1) is None:
+                    raise LatexError(f"`\\{name}` at character {at} must be followed by a delimiter such as ( or \\{{.", "syntax")
+                # The delimiter is part of this token, so "\left\{" doesn't open a group
+                position = delimiter.end()
+                if name == "left":
+                    stack.append(("left", None, at))
+                elif not stack or stack[-1][0] != "left":
+                    problem = "has no matching `\\left`" if not stack else f"comes before {_closer(stack[-1])}"
+                    raise LatexError(f"`\\{name}` at character {at} {problem}.", "unbalanced")
+                elif name == "right":
+                    stack.pop()
+
+        else:
+            char = match.group("char")
+            if char == "{":
+                stack.append(("{", None, at))
+            elif char == "}":
+                if not stack:
+                    raise LatexError(f"The }} at character {at} has no matching {{.", "unbalanced")
+                if stack[-1][0] != "{":
+                    raise LatexError(f"{_opener(stack[-1])} must be closed by {_closer(stack[-1])} before the }} at character {at}.", "unbalanced")
+                stack.pop()
+            elif char == "&":
+                if not any(kind == "env" for kind, _, _ in stack):
+                    raise LatexError(f"The & at character {at} is outside an environment such as aligned or matrix; use \\& for an ampersand.", "syntax")
+            elif char == "$":
+                raise LatexError(f"Please leave out the $ at character {at}, the equation is already in math mode.", "syntax")
+            elif char == "%":
+                raise LatexError(f"The % at character {at} would start a comment; use \\% for a percent sign.", "syntax")
+            elif char == "#":
+                raise LatexError(f"The # at character {at} can't be used in an equation; use \\# instead.", "syntax")
+            else:
+                raise LatexError(f"^^ character codes are not allowed (character {at}).", "forbidden")
+
+        if len(stack) > max_depth:
+            raise LatexError(f"The equation is nested more than {max_depth} levels deep at character {at}.", "depth")
+
+    if stack:
+        raise LatexError(f"{_opener(stack[-1])} is never closed by {_closer(stack[-1])}.", "unbalanced")
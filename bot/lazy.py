@@ -0,0 +1,49 @@
+"""
+Lazy module imports.
+
+sympy, matplotlib, scipy and the Gemini client take well over a second to
+import between them. Modules bound with lazy_import() are only imported when
+one of their attributes is first used, so the bot can connect first and load
+them afterwards (see warm_imports() in bot.py).
+"""
+import importlib
+import threading
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Worker threads may touch the module at the same time as the warm-up
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        module = self._module if self._module is not None else self._load()
+        return getattr(module, attribute)
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name) -> LazyModule:
+    """A module object that imports `name` the first time it is used."""
+    return LazyModule(name)
+
+
+def preload(*modules):
+    """Import lazy modules now, e.g. from a background thread after startup."""
+    for module in modules:
+        module._load()
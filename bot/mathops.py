@@ -0,0 +1,303 @@
+"""
+Symbolic operations run in sandboxed worker processes.
+
+Every operation runs in its own killable process with CPU and memory limits,
+so a pathological input costs a few seconds instead of tying up the bot.
+Results are memoized on the operation and the canonical srepr of the
+expression.
+
+The sandboxes are forked from a small host process that runs this module as
+its script and has imported sympy once. Nothing of the bot is loaded there,
+so a sandbox starts in milliseconds and without the bot's start-up side
+effects. Where fork is not available each operation gets a spawned process.
+"""
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+from cachetools import LRUCache
+
+from lazy import lazy_import
+
+# Loaded on first use; the sandbox host imports it before forking
+sp = lazy_import("sympy")
+
+try:
+    import resource
+except ImportError:  # Windows has no rlimits; the wall clock timeout still applies
+    resource = None
+
+OPERATIONS = ('simplify', 'factor', 'expand', 'solve', 'differentiate', 'integrate', 'limit')
+
+
+class ComputationTimeout(RuntimeError):
+    """Raised when an operation runs past its time limit."""
+
+
+def parse_expression(expression: str):
+    """Parse an expression, turning 'lhs = rhs' into an equation."""
+    if '=' in expression:
+        lhs, rhs = expression.split('=', 1)
+        return sp.Eq(sp.sympify(lhs), sp.sympify(rhs))
+    return sp.sympify(expression)
+
+
+def _variable(expr):
+    """x if it appears (or nothing does), otherwise the first free symbol."""
+    x = sp.Symbol('x')
+    symbols = expr.free_symbols
+    if x in symbols or not symbols:
+        return x
+    return sorted(symbols, key=str)[0]
+
+
+def apply_operation(operation: str, expr, point=None) -> str:
+    """Apply an operation to a parsed expression and return the result as LaTeX."""
+    var = _variable(expr)
+    if operation == 'solve':
+        solutions = sp.solve(expr, var)
+        if not solutions:
+            return r"\text{No solution}"
+        return r",\quad ".join(f"{sp.latex(var)} = {sp.latex(solution)}" for solution in solutions)
+
+    if isinstance(expr, sp.Eq):
+        # Everything but solve works on both sides of an equation
+        return sp.latex(sp.Eq(
+            _apply(operation, expr.lhs, var, point),
+            _apply(operation, expr.rhs, var, point),
+            evaluate=False,
+        ))
+    return sp.latex(_apply(operation, expr, var, point))
+
+
+def _apply(operation, expr, var, point=None):
+    if operation == 'simplify':
+        return sp.simplify(expr)
+    if operation == 'factor':
+        return sp.factor(expr)
+    if operation == 'expand':
+        return sp.expand(expr)
+    if operation == 'differentiate':
+        return sp.diff(expr, var)
+    if operation == 'integrate':
+        return sp.integrate(expr, var)
+    if operation == 'limit':
+        return sp.limit(expr, var, sp.sympify(point if point is not None else 0))
+    raise ValueError(f"Unsupported operation. Please use one of: {', '.join(OPERATIONS)}.")
+
+
+def _apply_limits(memory_mb, cpu_seconds):
+    if resource is None:
+        return
+    if cpu_seconds:
+        # SIGXCPU at the soft limit, SIGKILL one second later
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    if memory_mb:
+        # The worker already holds sympy, so the cap is on top of what is mapped now
+        try:
+            with open('/proc/self/statm', 'r') as f:
+                mapped = int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            mapped = 0
+        limit = mapped + memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _sandbox_main(conn, operation, expression, point, memory_mb, cpu_seconds):
+    _apply_limits(memory_mb, cpu_seconds)
+    try:
+        try:
+            expr = parse_expression(expression)
+        except (sp.SympifyError, SyntaxError, TypeError) as e:
+            conn.send(('parse_error', str(e)))
+            return
+        # Sent first so the parent can answer from its memo and stop us early
+        conn.send(('parsed', sp.srepr(expr)))
+        conn.send(('ok', apply_operation(operation, expr, point)))
+    except MemoryError:
+        conn.send(('error', "The computation ran out of memory."))
+    except Exception as e:
+        conn.send(('error', str(e) or type(e).__name__))
+    finally:
+        conn.close()
+
+
+def _sandbox_child(conn, job):
+    # The parent kills the sandbox by PID when it runs out of time
+    conn.send(('started', os.getpid()))
+    _sandbox_main(conn, *job)
+
+
+def serve():
+    """Run the sandbox host: read the auth key from stdin, print the address, fork a sandbox per job."""
+    authkey = bytes.fromhex(sys.stdin.readline().strip())
+    # Imported once here, so every sandbox starts with sympy loaded
+    sp.Basic
+    # Forked sandboxes are reaped by the kernel; Ctrl-C is for the bot, the host exits with it
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def exit_with_parent():
+        # stdin closes when the bot exits
+        sys.stdin.read()
+        os._exit(0)
+
+    threading.Thread(target=exit_with_parent, daemon=True).start()
+    listener = Listener(family="AF_UNIX", authkey=authkey)
+    print(listener.address, flush=True)
+    while True:
+        try:
+            conn = listener.accept()
+            job = conn.recv()
+        except (OSError, EOFError, multiprocessing.AuthenticationError):
+            continue
+        if os.fork() == 0:
+            try:
+                # The listener is left open: closing it would unlink the host's socket
+                _sandbox_child(conn, job)
+            finally:
+                os._exit(0)
+        conn.close()
+
+
+class SandboxHost:
+    """Starts the sandbox host process on first use and connects jobs to it."""
+
+    def __init__(self):
+        self._process = None
+        self._address = None
+        self._authkey = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._authkey = os.urandom(32)
+                self._process = subprocess.Popen(
+                    [sys.executable, os.path.abspath(__file__)],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    text=True,
+                )
+                self._process.stdin.write(self._authkey.hex() + "\n")
+                self._process.stdin.flush()
+                # Printed once sympy is imported and the host is listening
+                self._address = self._process.stdout.readline().strip()
+                if not self._address:
+                    raise RuntimeError("The math sandbox could not be started.")
+            return self._address, self._authkey
+
+    def launch(self, job):
+        """Send a job to the host, which forks a sandbox for it, and return the connection."""
+        address, authkey = self.start()
+        conn = Client(address, family="AF_UNIX", authkey=authkey)
+        conn.send(job)
+        return conn
+
+
+class SymbolicEngine:
+    """Runs operations in sandboxed processes and memoizes their results."""
+
+    def __init__(self, timeout=10.0, memory_mb=512, memo_size=1024):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.timeouts = 0
+        self.memo_hits = 0
+        self._by_text = LRUCache(maxsize=memo_size)
+        self._by_srepr = LRUCache(maxsize=memo_size)
+        self._lock = threading.Lock()
+        self.host = SandboxHost() if hasattr(os, "fork") else None
+
+    def warm(self):
+        """Start the sandbox host ahead of the first operation."""
+        if self.host is not None:
+            self.host.start()
+
+    def _memo_get(self, memo, key):
+        with self._lock:
+            result = memo.get(key)
+            if result is not None:
+                self.memo_hits += 1
+            return result
+
+    def compute(self, operation: str, expression: str, point=None) -> str:
+        """Blocking: run the operation in a sandbox and return LaTeX.
+
+        Raises sympy.SympifyError for unparsable input, ValueError for an
+        unknown operation, ComputationTimeout when the limits are hit and
+        RuntimeError for any other failure inside the sandbox.
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unsupported operation. Please use one of: {', '.join(OPERATIONS)}.")
+        text_key = (operation, " ".join(expression.split()), point)
+        result = self._memo_get(self._by_text, text_key)
+        if result is not None:
+            return result
+
+        job = (operation, expression, point, self.memory_mb, int(self.timeout) + 1)
+        deadline = time.monotonic() + self.timeout
+        parent_conn = self._launch(job)
+        pid = None
+        finished = False
+        try:
+            srepr_key = None
+            while True:
+                if not parent_conn.poll(max(deadline - time.monotonic(), 0)):
+                    self.timeouts += 1
+                    raise ComputationTimeout(f"That took longer than {self.timeout:g} seconds to compute, so it was stopped.")
+                try:
+                    status, value = parent_conn.recv()
+                except EOFError:
+                    # Killed by the CPU limit (SIGXCPU/SIGKILL) before it could report back
+                    finished = True
+                    self.timeouts += 1
+                    raise ComputationTimeout("That computation hit its time or memory limit, so it was stopped.")
+                if status == 'started':
+                    pid = value
+                elif status == 'parsed':
+                    srepr_key = (operation, value, point)
+                    result = self._memo_get(self._by_srepr, srepr_key)
+                    if result is not None:
+                        break
+                else:
+                    # The sandbox exits by itself after its answer
+                    finished = True
+                    if status == 'ok':
+                        result = value
+                        break
+                    if status == 'parse_error':
+                        raise sp.SympifyError(value)
+                    raise RuntimeError(value)
+        finally:
+            if pid is not None and not finished:
+                try:
+                    os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+                except OSError:
+                    pass
+            parent_conn.close()
+
+        with self._lock:
+            self._by_text[text_key] = result
+            if srepr_key is not None:
+                self._by_srepr[srepr_key] = result
+        return result
+
+    def _launch(self, job):
+        """Start a sandbox for one job and return the connection it answers on."""
+        if self.host is not None:
+            return self.host.launch(job)
+        # No fork (Windows): a freshly spawned process per operation
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe(duplex=False)
+        context.Process(target=_sandbox_child, args=(child_conn, job), daemon=True).start()
+        child_conn.close()
+        return parent_conn
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,79 @@
+"""
+Fast-path equation renderer using matplotlib's mathtext.
+
+mathtext understands a large subset of TeX math and renders straight to a PNG
+buffer in a few milliseconds, with no TeX install involved. can_use_mathtext
+decides whether an equation stays inside that subset; anything else goes to
+pdflatex.
+"""
+import re
+from io import BytesIO
+
+from matplotlib import mathtext
+from matplotlib.font_manager import FontProperties
+
+# Longer inputs are usually worked solutions that need real LaTeX layout
+MAX_LENGTH = 300
+
+_COMMAND = re.compile(r"\\([A-Za-z]+|.)")
+
+# Macros mathtext handles besides the plain symbols in tex2uni
+_SUPPORTED_COMMANDS = set("""
+    frac dfrac tfrac binom genfrac sqrt left right middle overline
+    hat breve bar grave dot ddot tilde acute vec check mathring widehat widetilde
+    overrightarrow overleftarrow
+    mathrm mathit mathbf mathsf mathtt mathcal mathbb mathfrak mathcircled mathdefault
+    rm it bf cal sf tt operatorname
+    quad qquad enspace thinspace
+    arccos csc ker min arcsin deg lg Pr arctan det lim sec arg dim liminf sin cos
+    exp limsup sinh cosh gcd ln sup cot hom log tan coth inf max tanh
+""".split())
+
+# Single character escapes such as "\{" or "\,"
+_SUPPORTED_ESCAPES = set("{}|,;:!%$_# ")
+
+try:
+    from matplotlib._mathtext_data import tex2uni
+    _SUPPORTED_COMMANDS.update(tex2uni)
+except ImportError:
+    pass
+
+
+def can_use_mathtext(equation: str) -> bool:
+    """Cheap check for whether an equation only uses constructs mathtext supports."""
+    equation = equation.strip()
+    if not equation or len(equation) > MAX_LENGTH:
+        return False
+    # Alignment tabs, comments, inline dollars and line breaks all need TeX
+    if any(char in equation for char in "&%$\n") or "\\\\" in equation:
+        return False
+
+    depth = 0
+    for char in equation:
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth < 0:
+                return False
+    if depth != 0:
+        return False
+
+    for name in _COMMAND.findall(equation):
+        if len(name) == 1 and not name.isalpha():
+            if name not in _SUPPORTED_ESCAPES:
+                return False
+        elif name not in _SUPPORTED_COMMANDS:
+            return False
+    return True
+
+
+def render_mathtext(equation: str, dpi=200, fontsize=12) -> bytes:
+    """Render an equation with mathtext and return the PNG bytes.
+
+    Raises ValueError if mathtext cannot parse the equation.
+    """
+    buffer = BytesIO()
+    prop = FontProperties(size=fontsize, math_fontfamily="cm")
+    mathtext.math_to_image(f"${equation.strip()}$", buffer, prop=prop, dpi=dpi, format="png")
+    return buffer.getvalue()
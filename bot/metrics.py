@@ -0,0 +1,178 @@
+"""
+In-process metrics: per-stage and per-command timers, event loop lag and gauges.
+
+Timings are kept as cumulative histograms and exposed in the Prometheus text
+format over a small local HTTP endpoint. The same numbers, averaged since the
+previous push, are flattened into the Cronitor metrics payload.
+"""
+import asyncio
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket bounds in seconds, from a cached image to a slow pdflatex run
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.total += seconds
+        self.count += 1
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[index] += 1
+                break
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Thread-safe registry of timing histograms and gauges."""
+
+    def __init__(self, prefix="latexbot"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        # name -> (help, label name, {label value: _Histogram})
+        self._histograms = {}
+        # name -> (help, callable returning a number or {label value: number})
+        self._gauges = {}
+        self._pushed = {}
+        self.last_loop_lag = 0.0
+        self.histogram("stage_seconds", "Time spent in each stage of a request.", "stage")
+        self.histogram("command_seconds", "Time from interaction to the end of each command.", "command")
+        self.histogram("loop_lag_seconds", "How late the event loop woke up from a sleep.")
+
+    def histogram(self, name, help_text, label=None):
+        """Register a histogram, optionally split by one label."""
+        with self._lock:
+            self._histograms.setdefault(name, (help_text, label, {}))
+
+    def gauge(self, name, help_text, read):
+        """Register a gauge whose value is read when metrics are collected."""
+        with self._lock:
+            self._gauges[name] = (help_text, read)
+
+    def observe(self, name, seconds, label_value=None):
+        with self._lock:
+            series = self._histograms[name][2]
+            if label_value not in series:
+                series[label_value] = _Histogram()
+            series[label_value].observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """Time the body of a with block as one run of a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage)
+
+    def timed(self, stage, fn):
+        """Wrap fn so every call is timed as a stage, wherever it runs."""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def _read_gauges(self):
+        values = {}
+        for name, (help_text, read) in list(self._gauges.items()):
+            try:
+                value = read()
+            except Exception as e:
+                print(f"Could not read gauge {name}: {e}")
+                continue
+            values[name] = (help_text, value)
+        return values
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            histograms = {
+                name: (help_text, label, {value: (list(h.counts), h.total, h.count) for value, h in series.items()})
+                for name, (help_text, label, series) in self._histograms.items()
+            }
+        for name, (help_text, label, series) in histograms.items():
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} histogram")
+            for value, (counts, total, count) in sorted(series.items(), key=lambda item: str(item[0])):
+                labels = f'{label}="{_escape(value)}",' if label else ""
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{full_name}_bucket{{{labels}le="{bound:g}"}} {cumulative}')
+                lines.append(f'{full_name}_bucket{{{labels}le="+Inf"}} {count}')
+                plain = f"{{{labels.rstrip(',')}}}" if labels else ""
+                lines.append(f"{full_name}_sum{plain} {total:.6f}")
+                lines.append(f"{full_name}_count{plain} {count}")
+        for name, (help_text, value) in self._read_gauges().items():
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} gauge")
+            if isinstance(value, dict):
+                for key, item in sorted(value.items()):
+                    lines.append(f'{full_name}{{key="{_escape(key)}"}} {item:g}')
+            else:
+                lines.append(f"{full_name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Flat numbers for Cronitor: mean milliseconds per series since the last call, plus gauges."""
+        payload = {}
+        with self._lock:
+            for name, (_, _, series) in self._histograms.items():
+                for value, histogram in series.items():
+                    key = f"{name.replace('_seconds', '')}_{value}" if value is not None else name.replace('_seconds', '')
+                    last_total, last_count = self._pushed.get(key, (0.0, 0))
+                    calls = histogram.count - last_count
+                    if calls:
+                        payload[f"{key}_ms"] = round((histogram.total - last_total) / calls * 1000, 1)
+                        payload[f"{key}_count"] = calls
+                    self._pushed[key] = (histogram.total, histogram.count)
+        for name, (_, value) in self._read_gauges().items():
+            if isinstance(value, dict):
+                payload.update({f"{name}_{key}": round(item, 3) for key, item in value.items()})
+            else:
+                payload[name] = round(value, 3)
+        return payload
+
+
+async def sample_loop_lag(metrics: Metrics, interval=0.5):
+    """Forever: measure how late the event loop wakes up from a sleep."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - start - interval, 0.0)
+        metrics.observe("loop_lag_seconds", lag)
+        metrics.last_loop_lag = lag
+
+
+async def start_http_server(metrics: Metrics, host="127.0.0.1", port=9108):
+    """Serve /metrics on host:port and return the aiohttp runner (call .cleanup() to stop)."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,152 @@
+"""
+Function plotting engine.
+
+Expressions are compiled once into vectorized NumPy callables and cached, both
+by their text and by their canonical sympy form, so popular plots skip sympy
+entirely. Sampling starts from a coarse grid, refines where the curve bends
+and breaks the line at poles, jumps and undefined regions.
+"""
+from functools import lru_cache
+
+import numpy as np
+import sympy as sp
+
+X = sp.Symbol('x')
+
+INITIAL_SAMPLES = 257
+MAX_SAMPLES = 4000
+REFINE_PASSES = 6
+# Second difference, relative to the plot height, above which a segment is split
+CURVATURE_TOLERANCE = 0.005
+# Jumps bigger than this fraction of the plot height are checked for discontinuities
+JUMP_FRACTION = 0.02
+# Bisections used to tell a steep but continuous segment from a real jump
+JUMP_BISECTIONS = 12
+
+
+def normalize_expression(expression: str) -> str:
+    """Strip 'y=' / 'f(x)=' prefixes and whitespace."""
+    if '=' in expression:
+        expression = expression.split('=')[-1]
+    return "".join(expression.split())
+
+
+@lru_cache(maxsize=512)
+def _compile_canonical(canonical: str):
+    # Many spellings ('x^2+1', 'x**2 + 1', '1+x*x') end up here with the same key
+    return sp.lambdify(X, sp.sympify(canonical), 'numpy')
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression: str):
+    """Return a vectorized callable for an expression in x."""
+    expr = sp.sympify(expression)
+    extra = expr.free_symbols - {X}
+    if extra:
+        names = ", ".join(sorted(str(symbol) for symbol in extra))
+        raise ValueError(f"Only x can be used as a variable (found {names}).")
+    return _compile_canonical(sp.srepr(expr))
+
+
+def evaluate(f, x):
+    """Evaluate f on an array, turning complex, infinite and failed values into NaN."""
+    with np.errstate(all='ignore'):
+        y = np.asarray(f(x))
+    if np.iscomplexobj(y):
+        y = np.where(np.abs(y.imag) < 1e-12, y.real, np.nan)
+    y = np.broadcast_to(y.astype(float), x.shape).copy()
+    y[~np.isfinite(y)] = np.nan
+    return y
+
+
+def _plot_height(y):
+    finite = y[np.isfinite(y)]
+    if finite.size == 0:
+        return 1.0
+    low, high = np.percentile(finite, [5, 95])
+    return max(high - low, 1e-9)
+
+
+def _refine(f, x, y):
+    """Insert midpoints where the curve turns sharply or meets an undefined region."""
+    for _ in range(REFINE_PASSES):
+        budget = MAX_SAMPLES - x.size
+        if budget <= 0:
+            break
+        height = _plot_height(y)
+        curvature = np.abs(y[:-2] - 2 * y[1:-1] + y[2:]) / height
+        bent = curvature > CURVATURE_TOLERANCE
+        split = np.zeros(x.size - 1, dtype=bool)
+        split[:-1] |= bent
+        split[1:] |= bent
+        # Edges of the domain (sqrt, log, ...) get extra samples too
+        finite = np.isfinite(y)
+        split |= finite[:-1] != finite[1:]
+        segments = np.nonzero(split)[0][:budget]
+        if segments.size == 0:
+            break
+        midpoints = (x[segments] + x[segments + 1]) / 2
+        x = np.insert(x, segments + 1, midpoints)
+        y = np.insert(y, segments + 1, evaluate(f, midpoints))
+    return x, y
+
+
+def _find_breaks(f, x, y):
+    """Return the indices i where the segment from i to i + 1 crosses a discontinuity."""
+    threshold = _plot_height(y) * JUMP_FRACTION
+    with np.errstate(invalid='ignore'):
+        candidates = np.nonzero(np.abs(np.diff(y)) > threshold)[0]
+    if candidates.size == 0:
+        return candidates
+
+    lo, hi = x[candidates], x[candidates + 1]
+    y_lo, y_hi = y[candidates], y[candidates + 1]
+    broken = np.zeros(candidates.size, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        for _ in range(JUMP_BISECTIONS):
+            mid = (lo + hi) / 2
+            y_mid = evaluate(f, mid)
+            broken |= ~np.isfinite(y_mid)
+            # Keep following the half that holds most of the change
+            left = np.abs(y_mid - y_lo) >= np.abs(y_hi - y_mid)
+            hi, y_hi = np.where(left, mid, hi), np.where(left, y_mid, y_hi)
+            lo, y_lo = np.where(left, lo, mid), np.where(left, y_lo, y_mid)
+        # A continuous curve shrinks to nothing under bisection, a pole or jump doesn't
+        broken |= np.abs(y_hi - y_lo) > threshold
+    return candidates[broken]
+
+
+def sample_function(expression: str, x_min=-10.0, x_max=10.0):
+    """Sample an expression over [x_min, x_max] for plotting.
+
+    Returns x and y arrays where NaN marks the places the line must break.
+    """
+    if not x_min < x_max:
+        raise ValueError("The domain must have x_min smaller than x_max.")
+    f = compile_expression(normalize_expression(expression))
+    x = np.linspace(x_min, x_max, INITIAL_SAMPLES)
+    y = evaluate(f, x)
+    x, y = _refine(f, x, y)
+    breaks = _find_breaks(f, x, y)
+    if breaks.size:
+        x = np.insert(x, breaks + 1, np.nan)
+        y = np.insert(y, breaks + 1, np.nan)
+    return x, y
+
+
+def view_limits(curves):
+    """y limits that keep asymptotes from squashing the rest of the plot, or None."""
+    values = np.concatenate([y[np.isfinite(y)] for _, y in curves] or [np.array([])])
+    if values.size == 0:
+        return None
+    low, high = np.percentile(values, [2, 98])
+    if values.min() >= low - (high - low) and values.max() <= high + (high - low):
+        # Nothing extreme, let matplotlib autoscale
+        return None
+    margin = (high - low) * 0.25 or 1.0
+    return low - margin, high + margin
+
+
+def split_expressions(expression: str):
+    """Several functions can be plotted together by separating them with ';'."""
+    return [part.strip() for part in expression.split(';') if part.strip()]
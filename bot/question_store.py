@@ -0,0 +1,125 @@
+"""
+Indexed, hot-reloadable question banks for quizzes and the QOTD.
+
+Both JSON files are parsed once into in-memory indexes (QOTD by date, quiz
+questions by topic and difficulty). When a file's mtime changes the banks are
+re-read and the whole index is swapped in one assignment, so readers never
+see a half-built index.
+"""
+import bisect
+import datetime
+import json
+import os
+import threading
+import time
+
+UNRATED = "unrated"
+
+
+class _Snapshot:
+    """One immutable view of both question banks."""
+
+    __slots__ = ("qotd_by_date", "qotd_dates", "quiz_by_topic", "quiz_by_topic_difficulty", "difficulties", "mtimes")
+
+    def __init__(self, qotd, quiz, mtimes):
+        self.qotd_by_date = qotd
+        self.qotd_dates = sorted(qotd)
+        self.quiz_by_topic = quiz
+        self.quiz_by_topic_difficulty = {}
+        difficulties = set()
+        for topic, entries in quiz.items():
+            for entry in entries:
+                difficulty = str(entry.get("difficulty", UNRATED)).lower()
+                difficulties.add(difficulty)
+                self.quiz_by_topic_difficulty.setdefault((topic, difficulty), []).append(entry)
+        self.difficulties = sorted(difficulties)
+        self.mtimes = mtimes
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def format_date(date: str) -> str:
+    """'2024-05-01' -> 'May 1, 2024'."""
+    day = datetime.date.fromisoformat(date)
+    return f"{day:%B} {day.day}, {day.year}"
+
+
+class QuestionStore:
+    """Serves quiz and QOTD questions from an index that follows the files on disk."""
+
+    def __init__(self, questions_path="bot/questions.json", qotd_path="bot/qotd.json", check_interval=2.0):
+        self.questions_path = questions_path
+        self.qotd_path = qotd_path
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._snapshot = self._load()
+
+    def _load(self):
+        mtimes = (_mtime(self.questions_path), _mtime(self.qotd_path))
+        return _Snapshot(_read_json(self.qotd_path), _read_json(self.questions_path), mtimes)
+
+    def _current(self):
+        """The current snapshot, reloading first if either file changed on disk."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._snapshot
+        with self._lock:
+            self._checked_at = now
+            mtimes = (_mtime(self.questions_path), _mtime(self.qotd_path))
+            if mtimes != self._snapshot.mtimes:
+                try:
+                    self._snapshot = self._load()
+                    self.reloads += 1
+                except (OSError, ValueError) as e:
+                    # Keep serving the old banks until the file is fixed
+                    print(f"Could not reload question banks: {e}")
+        return self._snapshot
+
+    def qotd(self, date: str):
+        """The QOTD entry for a YYYY-MM-DD date, or None."""
+        return self._current().qotd_by_date.get(date)
+
+    def qotd_today(self):
+        return self.qotd(time.strftime("%Y-%m-%d"))
+
+    def past_qotd_dates(self, query="", limit=25):
+        """Past QOTD dates (newest first) whose date or spelled-out name contains query."""
+        snapshot = self._current()
+        today = time.strftime("%Y-%m-%d")
+        end = bisect.bisect_right(snapshot.qotd_dates, today)
+        query = query.strip().lower()
+        matches = []
+        for date in reversed(snapshot.qotd_dates[:end]):
+            if not query or query in date or query in format_date(date).lower():
+                matches.append(date)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    def topics(self):
+        return list(self._current().quiz_by_topic)
+
+    def difficulties(self):
+        return self._current().difficulties
+
+    def quiz_questions(self, topic: str, difficulty: str = None):
+        """Questions for a topic, optionally only one difficulty."""
+        snapshot = self._current()
+        if difficulty:
+            return snapshot.quiz_by_topic_difficulty.get((topic, difficulty.lower()), [])
+        return snapshot.quiz_by_topic.get(topic, [])
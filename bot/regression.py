@@ -0,0 +1,132 @@
+"""
+Regression models for the data behind /input_table plots.
+
+Linear, exponential, logarithmic and power models are linearized (with log
+transforms where needed) and solved together in closed form as one stacked
+array operation; the polynomial is a least squares fit. Every model is then
+scored in the original y units, so R² and AIC are comparable across models.
+"""
+import numpy as np
+
+MODELS = ("linear", "polynomial", "exponential", "logarithmic", "power")
+MAX_DEGREE = 6
+# Points on the drawn fit curve, however large the dataset
+CURVE_POINTS = 400
+
+
+class Fit:
+    __slots__ = ("model", "params", "r2", "aic")
+
+    def __init__(self, model, params, r2, aic):
+        self.model = model
+        self.params = params
+        self.r2 = r2
+        self.aic = aic
+
+    def predict(self, x):
+        if self.model == "polynomial":
+            return self.params(x)
+        a, b = self.params
+        if self.model == "linear":
+            return a + b * x
+        if self.model == "exponential":
+            return a * np.exp(b * x)
+        if self.model == "logarithmic":
+            return a + b * np.log(x)
+        return a * np.power(x, b)
+
+    @property
+    def label(self):
+        if self.model == "polynomial":
+            return f"Polynomial (degree {self.params.degree()})"
+        return self.model.title()
+
+    @property
+    def equation(self):
+        if self.model == "polynomial":
+            coefficients = self.params.convert().coef
+            terms = []
+            for power, coefficient in reversed(list(enumerate(coefficients))):
+                # Rounding noise left over from the scaled fit
+                if abs(coefficient) < 1e-12 * np.abs(coefficients).max():
+                    continue
+                terms.append(f"{coefficient:.3g}" + ("" if power == 0 else "x" if power == 1 else f"x^{power}"))
+            return "y = " + " + ".join(terms).replace("+ -", "- ")
+        a, b = self.params
+        if self.model == "linear":
+            return f"y = {b:.3g}x + {a:.3g}".replace("+ -", "- ")
+        if self.model == "exponential":
+            return f"y = {a:.3g}e^({b:.3g}x)"
+        if self.model == "logarithmic":
+            return f"y = {a:.3g} + {b:.3g} ln x".replace("+ -", "- ")
+        return f"y = {a:.3g}x^{b:.3g}"
+
+
+def fit_models(x, y, degree=2):
+    """Fit every model the data allows and return them best first (lowest AIC)."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n < 2 or np.ptp(x) == 0:
+        raise ValueError("Fitting needs at least two different x values.")
+
+    log_x = np.log(x) if (x > 0).all() else None
+    log_y = np.log(y) if (y > 0).all() else None
+    # (model, regressor, target, target is log y)
+    candidates = [("linear", x, y, False)]
+    if log_y is not None:
+        candidates.append(("exponential", x, log_y, True))
+    if log_x is not None:
+        candidates.append(("logarithmic", log_x, y, False))
+    if log_x is not None and log_y is not None:
+        candidates.append(("power", log_x, log_y, True))
+
+    # Simple regression of every candidate at once: one row per model
+    u = np.stack([candidate[1] for candidate in candidates])
+    v = np.stack([candidate[2] for candidate in candidates])
+    u_mean = u.mean(axis=1, keepdims=True)
+    v_mean = v.mean(axis=1, keepdims=True)
+    du = u - u_mean
+    slopes = np.einsum("ij,ij->i", du, v - v_mean) / np.einsum("ij,ij->i", du, du)
+    intercepts = v_mean[:, 0] - slopes * u_mean[:, 0]
+    predictions = intercepts[:, None] + slopes[:, None] * u
+    log_target = np.array([candidate[3] for candidate in candidates])
+    with np.errstate(over="ignore"):
+        predictions[log_target] = np.exp(predictions[log_target])
+
+    params = [
+        (np.exp(intercept) if logged else intercept, slope)
+        for intercept, slope, logged in zip(intercepts, slopes, log_target)
+    ]
+    models = [candidate[0] for candidate in candidates]
+    sizes = [2] * len(candidates)
+
+    degree = min(degree, MAX_DEGREE)
+    if n > degree + 1:
+        # Polynomial.fit scales x to [-1, 1] first, which keeps high degrees well conditioned
+        polynomial = np.polynomial.Polynomial.fit(x, y, degree)
+        predictions = np.vstack([predictions, polynomial(x)])
+        params.append(polynomial)
+        models.append("polynomial")
+        sizes.append(degree + 1)
+
+    residuals = y - predictions
+    ss_res = np.einsum("ij,ij->i", residuals, residuals)
+    ss_tot = np.sum((y - y.mean()) ** 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2 = 1 - ss_res / ss_tot if ss_tot else np.where(ss_res == 0, 1.0, 0.0)
+        aic = n * np.log(np.maximum(ss_res, np.finfo(float).tiny) / n) + 2 * np.array(sizes)
+
+    fits = [
+        Fit(model, parameters, float(score), float(criterion))
+        for model, parameters, score, criterion in zip(models, params, r2, aic)
+        # An exponential that overflows has no usable score
+        if np.isfinite(score) and np.isfinite(criterion)
+    ]
+    return sorted(fits, key=lambda fit: (fit.aic, -fit.r2))
+
+
+def curve(fit, x):
+    """Points to draw a fit over the range of x."""
+    grid = np.linspace(np.min(x), np.max(x), CURVE_POINTS)
+    return grid, fit.predict(grid)
@@ -0,0 +1,216 @@
+"""
+Content-addressed cache for rendered equation images.
+
+Rendered bytes (PNG or WebP images, compiled PDFs) are kept in a bounded
+in-memory LRU that sits in front of a size-capped store on disk, so repeat
+renders skip pdflatex entirely. The key says what an entry holds, so files
+on disk use the neutral .bin extension.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def normalize_equation(equation: str) -> str:
+    """Collapse whitespace so trivially different inputs share a cache entry."""
+    return " ".join(equation.split())
+
+
+def make_key(equation: str, settings: dict) -> str:
+    """Hash the normalized equation together with the settings used to render it."""
+    payload = json.dumps({"equation": normalize_equation(equation), "settings": settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """Two tier (memory LRU + disk) cache of rendered bytes."""
+
+    EXTENSION = ".bin"
+
+    # The disk tier may be shared with other processes, so the directory is
+    # re-measured every few writes instead of trusting this process's own count
+    RESCAN_EVERY = 32
+
+    def __init__(self, max_items=256, disk_dir='bot/tmp/cache', max_disk_bytes=64 * 1024 * 1024):
+        self.max_items = max_items
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self._disk_writes = 0
+        if self.disk_dir and self.max_disk_bytes > 0:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._remove_legacy_files()
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}{self.EXTENSION}")
+
+    def _disk_files(self):
+        return [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir) if name.endswith(self.EXTENSION)]
+
+    def _remove_legacy_files(self):
+        # Entries used to be saved as .png whatever they held; they would never be evicted now
+        for name in os.listdir(self.disk_dir):
+            if name.endswith('.png'):
+                try:
+                    os.remove(os.path.join(self.disk_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def _disk_entries(self):
+        """(modified time, size, path) of every file on disk, skipping ones removed meanwhile."""
+        entries = []
+        for path in self._disk_files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Evicted by another process sharing the directory
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _disk_enabled(self):
+        return bool(self.disk_dir) and self.max_disk_bytes > 0
+
+    def get(self, key: str):
+        """Return the cached bytes for key, or None on a miss."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+            if self._disk_enabled():
+                path = self._disk_path(key)
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    # Touch the file so disk eviction stays least-recently-used
+                    os.utime(path)
+                except OSError:
+                    data = None
+                if data is not None:
+                    self.disk_hits += 1
+                    self._remember(key, data)
+                    return data
+
+            self.misses += 1
+            return None
+
+    def peek(self, key: str):
+        """Return the bytes for key if they are in memory, without touching the disk.
+
+        Safe to call from the event loop: it never waits for the lock, a render
+        thread holding it (perhaps for a disk write) just makes this a miss.
+        Misses aren't counted, the full lookup that follows counts them.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+            return data
+        finally:
+            self._lock.release()
+
+    def remember(self, key: str, data: bytes):
+        """Keep bytes rendered elsewhere (by a render worker) in the memory tier only.
+
+        Like peek, this is for the event loop and skips storing rather than wait for the lock.
+        """
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._remember(key, data)
+        finally:
+            self._lock.release()
+
+    def put(self, key: str, data: bytes):
+        """Store bytes in both tiers, evicting old entries as needed."""
+        with self._lock:
+            self._remember(key, data)
+            if self._disk_enabled() and len(data) <= self.max_disk_bytes:
+                path = self._disk_path(key)
+                if not os.path.exists(path):
+                    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+                    with open(tmp_path, 'wb') as f:
+                        f.write(data)
+                    os.replace(tmp_path, path)
+                    self._disk_bytes += len(data)
+                    self._disk_writes += 1
+                    if self._disk_bytes > self.max_disk_bytes or self._disk_writes % self.RESCAN_EVERY == 0:
+                        self._evict_disk()
+
+    def invalidate(self, key: str):
+        """Drop a single entry from both tiers."""
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._disk_enabled():
+                path = self._disk_path(key)
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                except FileNotFoundError:
+                    return
+                self._disk_bytes -= size
+
+    def clear(self):
+        """Drop every cached image."""
+        with self._lock:
+            self._memory.clear()
+            if self._disk_enabled():
+                for path in self._disk_files():
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                self._disk_bytes = 0
+
+    def stats(self):
+        """Counters describing how well the cache is doing."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_evictions': self.memory_evictions,
+                'disk_evictions': self.disk_evictions,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'memory_items': len(self._memory),
+                'disk_bytes': self._disk_bytes,
+            }
+
+    def _remember(self, key, data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+            self.memory_evictions += 1
+
+    def _evict_disk(self):
+        # Measured from the directory, so files written by other processes count against the cap
+        entries = self._disk_entries()
+        self._disk_bytes = sum(size for _, size, _ in entries)
+        # Oldest access time first
+        for _, size, path in sorted(entries):
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                self.disk_evictions += 1
+            except FileNotFoundError:
+                # Another process evicted it first
+                pass
+            self._disk_bytes -= size
@@ -0,0 +1,109 @@
+"""
+In-memory helpers for the render pipeline.
+
+TeX still needs a working directory, so each job gets its own isolated
+scratch directory (on tmpfs when available). Everything after the compiler
+stays in memory as bytes.
+
+Equation images are rasterized in grayscale and quantized to a small palette
+before encoding, optionally as WebP or in a transparent or dark-theme variant.
+"""
+import os
+import tempfile
+from io import BytesIO
+
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
+from PIL import Image, ImageOps
+
+SHM_DIR = "/dev/shm"
+
+FORMATS = ("png", "webp")
+THEMES = ("light", "dark", "transparent")
+# Anti-aliased black-on-white text survives 16 gray levels without visible banding
+PALETTE_COLORS = 16
+# Discord's dark theme message background and text colour
+DARK_BACKGROUND = (49, 51, 56)
+DARK_INK = (219, 222, 225)
+# Pages are measured before rasterizing; a long equation at 600 DPI is a few megapixels
+MAX_PIXELS = 24_000_000
+
+
+def scratch_root():
+    """Directory new scratch dirs are created in, preferring tmpfs."""
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        return SHM_DIR
+    return None
+
+
+def scratch_dir():
+    """A private directory for one job, removed when the context exits."""
+    return tempfile.TemporaryDirectory(prefix="latexbot-", dir=scratch_root())
+
+
+def page_pixels(pdf: bytes, dpi) -> int:
+    """How many pixels the first page of a PDF rasterizes to at the given DPI."""
+    # Reported in points, e.g. "52.3 x 20.1 pts"
+    width, _, height = pdfinfo_from_bytes(pdf, first_page=1, last_page=1)["Page size"].split()[:3]
+    return round(float(width) / 72 * dpi) * round(float(height) / 72 * dpi)
+
+
+def rasterize_pdf(pdf: bytes, dpi=200):
+    """Rasterize the first page of a PDF into a grayscale PIL image.
+
+    Raises ValueError when the page would be larger than MAX_PIXELS.
+    """
+    try:
+        pixels = page_pixels(pdf, dpi)
+    except Exception as e:
+        raise RuntimeError(f"Error reading the PDF page size: {e}")
+    if pixels > MAX_PIXELS:
+        raise ValueError(f"The equation is too large to render at {dpi} DPI, please try a lower resolution.")
+    try:
+        pages = convert_from_bytes(pdf, dpi=dpi, first_page=1, last_page=1, grayscale=True)
+        return pages[0]
+    except Exception as e:
+        raise RuntimeError(f"Error converting PDF to PNG: {e}")
+
+
+def _grayscale(image):
+    if image.mode in ("RGBA", "LA", "P"):
+        # Flatten transparency onto white so the ink stays dark
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, "white")
+        image = Image.alpha_composite(background, image)
+    return image.convert("L")
+
+
+def encode_image(image, fmt="png", theme="light") -> bytes:
+    """Encode a dark-on-light rendering as a palette image in the given format and theme."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported image format. Please use one of: {', '.join(FORMATS)}.")
+    if theme not in THEMES:
+        raise ValueError(f"Unsupported theme. Please use one of: {', '.join(THEMES)}.")
+
+    gray = _grayscale(image)
+    if theme == "light":
+        quantized = gray.quantize(colors=PALETTE_COLORS)
+    else:
+        # How much ink covers each pixel, 0 (paper) to 255 (solid)
+        ink = ImageOps.invert(gray)
+        if theme == "transparent":
+            layers = Image.merge("RGBA", (*Image.new("RGB", gray.size, "black").split(), ink))
+            quantized = layers.quantize(colors=PALETTE_COLORS, method=Image.Quantize.FASTOCTREE)
+        else:
+            colored = Image.composite(Image.new("RGB", gray.size, DARK_INK), Image.new("RGB", gray.size, DARK_BACKGROUND), ink)
+            quantized = colored.quantize(colors=PALETTE_COLORS)
+
+    buffer = BytesIO()
+    if fmt == "webp":
+        quantized.save(buffer, format="WEBP", lossless=True)
+    else:
+        quantized.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def figure_to_png(figure, **savefig_kwargs) -> bytes:
+    """Save a matplotlib figure into PNG bytes."""
+    buffer = BytesIO()
+    figure.savefig(buffer, format='png', **savefig_kwargs)
+    return buffer.getvalue()
@@ -0,0 +1,207 @@
+"""
+Client side of the render worker service.
+
+Render, plot and sympy jobs can run in separate worker processes
+(render_worker.py), each listening on a Unix socket in a shared directory.
+Every job opens one connection and sends one request frame. The worker
+answers with zero or more "chunk" frames (streamed partial results) and one
+final frame. Jobs carry an ID, go to the least busy healthy worker and are
+retried on another worker if the connection fails. When no worker could
+take a job, NoWorkerError tells the caller it is safe to run it itself.
+
+A frame is two big-endian uint32 lengths followed by a JSON header and a
+binary body.
+"""
+import asyncio
+import glob
+import json
+import os
+import struct
+import time
+import uuid
+
+_LENGTHS = struct.Struct(">II")
+
+
+class WorkerUnavailableError(RuntimeError):
+    """Raised when no worker could take a job."""
+
+
+class NoWorkerError(WorkerUnavailableError):
+    """Raised when no worker started a job, so it can run somewhere else instead."""
+
+
+class RemoteJobError(RuntimeError):
+    """A job failed inside a worker with an exception type the bot doesn't know."""
+
+
+async def write_frame(writer, header: dict, body: bytes = b""):
+    data = json.dumps(header).encode("utf-8")
+    writer.write(_LENGTHS.pack(len(data), len(body)) + data + body)
+    await writer.drain()
+
+
+async def read_frame(reader):
+    """Read one frame and return (header, body). Raises IncompleteReadError on EOF."""
+    header_length, body_length = _LENGTHS.unpack(await reader.readexactly(_LENGTHS.size))
+    header = json.loads(await reader.readexactly(header_length))
+    body = await reader.readexactly(body_length) if body_length else b""
+    return header, body
+
+
+class _Worker:
+    __slots__ = ("path", "healthy", "in_flight", "failures", "checked_at", "info")
+
+    def __init__(self, path):
+        self.path = path
+        self.healthy = True
+        self.in_flight = 0
+        self.failures = 0
+        self.checked_at = 0.0
+        self.info = {}
+
+
+class WorkerClient:
+    """Sends jobs to the render workers found in socket_dir."""
+
+    def __init__(self, socket_dir, timeout=60.0, retries=2, error_types=()):
+        self.socket_dir = socket_dir
+        self.timeout = timeout
+        self.retries = retries
+        # Worker exceptions are re-raised as the bot's own types, matched by name.
+        # A callable is resolved on the first error so its modules can load lazily.
+        self._error_types = error_types
+        self._errors_by_name = None
+        self.jobs = 0
+        self.retried = 0
+        self.no_worker = 0
+        self._workers = {}
+
+    @property
+    def error_types(self):
+        if self._errors_by_name is None:
+            types = self._error_types() if callable(self._error_types) else self._error_types
+            self._errors_by_name = {error.__name__: error for error in types}
+        return self._errors_by_name
+
+    def _discover(self):
+        paths = set(glob.glob(os.path.join(self.socket_dir, "*.sock")))
+        for path in paths - self._workers.keys():
+            self._workers[path] = _Worker(path)
+        for path in self._workers.keys() - paths:
+            del self._workers[path]
+
+    def healthy_workers(self):
+        return [worker for worker in self._workers.values() if worker.healthy]
+
+    @property
+    def available(self):
+        self._discover()
+        return bool(self.healthy_workers())
+
+    def _pick(self, exclude):
+        candidates = [worker for worker in self.healthy_workers() if worker.path not in exclude]
+        if not candidates:
+            self.no_worker += 1
+            raise NoWorkerError("No render worker is available right now.")
+        return min(candidates, key=lambda worker: worker.in_flight)
+
+    async def _ping(self, worker):
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(worker.path), 2)
+            try:
+                await write_frame(writer, {"id": uuid.uuid4().hex, "type": "ping"})
+                header, _ = await asyncio.wait_for(read_frame(reader), 2)
+            finally:
+                writer.close()
+            worker.healthy = header.get("status") == "ok"
+            worker.info = header.get("value", {})
+        except ConnectionRefusedError:
+            # Nothing listens there any more: a worker that was killed left its socket behind
+            worker.healthy = False
+            try:
+                os.unlink(worker.path)
+            except OSError:
+                pass
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, json.JSONDecodeError):
+            worker.healthy = False
+        worker.checked_at = time.monotonic()
+        if worker.healthy:
+            worker.failures = 0
+
+    async def check_health(self):
+        """Ping every worker socket and mark each one healthy or not."""
+        self._discover()
+        await asyncio.gather(*(self._ping(worker) for worker in self._workers.values()))
+        return {os.path.basename(worker.path): worker.healthy for worker in self._workers.values()}
+
+    async def stream(self, job_type, body=b"", **params):
+        """Run a job and yield (header, body) for every frame the worker sends, ending with the result."""
+        self._discover()
+        job_id = uuid.uuid4().hex
+        self.jobs += 1
+        tried = set()
+        for attempt in range(self.retries + 1):
+            worker = self._pick(tried)
+            tried.add(worker.path)
+            worker.in_flight += 1
+            started = False
+            failed = None
+            try:
+                try:
+                    reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(worker.path), 5)
+                except asyncio.TimeoutError as e:
+                    # Nothing was sent yet, so this is retried like a refused connection
+                    raise ConnectionError("timed out connecting") from e
+                try:
+                    await write_frame(writer, {"id": job_id, "type": job_type, "params": params}, body)
+                    while True:
+                        header, data = await asyncio.wait_for(read_frame(reader), self.timeout)
+                        if header.get("id") != job_id:
+                            raise ConnectionError(f"worker answered job {header.get('id')} instead of {job_id}")
+                        started = True
+                        if header.get("status") == "error":
+                            failed = header
+                            break
+                        yield header, data
+                        if header.get("status") != "chunk":
+                            return
+                finally:
+                    writer.close()
+            except asyncio.TimeoutError as e:
+                # The job may still be running there, so it is not sent anywhere else
+                raise WorkerUnavailableError("The render worker took too long to answer.") from e
+            except (OSError, asyncio.IncompleteReadError, json.JSONDecodeError) as e:
+                # A worker that died mid-stream may have sent part of the result already
+                if started:
+                    raise WorkerUnavailableError(f"The render worker failed: {e}") from e
+                worker.healthy = False
+                worker.failures += 1
+                if attempt == self.retries:
+                    self.no_worker += 1
+                    raise NoWorkerError(f"The render worker failed: {e}") from e
+                self.retried += 1
+                print(f"Render worker {os.path.basename(worker.path)} failed job {job_id}, retrying: {e}")
+                continue
+            finally:
+                worker.in_flight -= 1
+
+            error_type = self.error_types.get(failed.get("error_type"), RemoteJobError)
+            raise error_type(failed.get("message") or "The job failed in the render worker.")
+
+    async def call(self, job_type, body=b"", **params):
+        """Run a job and return the final (header, body)."""
+        result = None
+        async for result in self.stream(job_type, body, **params):
+            pass
+        return result
+
+    def stats(self):
+        return {
+            "workers": len(self._workers),
+            "healthy": len(self.healthy_workers()),
+            "in_flight": sum(worker.in_flight for worker in self._workers.values()),
+            "jobs": self.jobs,
+            "retried": self.retried,
+            "no_worker": self.no_worker,
+        }
@@ -0,0 +1,130 @@
+"""
+Render worker service.
+
+Runs the bot's render, plot, draw, batch and sympy jobs for a gateway
+process that talks to it over a Unix socket (see render_service.py), so
+rendering can be scaled with more worker replicas. Run from the repository
+root:
+
+    python bot/render_worker.py --socket-dir bot/tmp/workers
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sys
+import time
+
+from render_service import read_frame, write_frame
+
+# The worker reuses the bot's pipeline but must never forward jobs to other workers
+os.environ["RENDER_WORKERS_DIR"] = ""
+os.environ.setdefault("GUILD_ID", "0")
+import bot as pipeline
+
+
+class RenderWorker:
+    """Answers job frames on one Unix socket."""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.started_at = time.time()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def run_job(self, job_type, params, writer, job_id):
+        """Run one job, sending a chunk frame per result where the job has several."""
+        if job_type == "ping":
+            await write_frame(writer, {"id": job_id, "status": "ok", "value": {
+                "pid": os.getpid(),
+                "pending": self.pending,
+                "completed": self.completed,
+                "failed": self.failed,
+                "uptime": round(time.time() - self.started_at),
+                "tex_pool": pipeline.tex_pool.ready,
+            }})
+            return
+        if job_type == "render":
+            png = await pipeline.render_equation_shared(params["equation"], params.get("dpi"), params.get("fmt"), params.get("theme"))
+            await write_frame(writer, {"id": job_id, "status": "ok"}, png)
+        elif job_type == "plot":
+            png, error = await pipeline.plot_function_shared(params["expressions"], params["x_min"], params["x_max"])
+            await write_frame(writer, {"id": job_id, "status": "ok", "value": error}, png or b"")
+        elif job_type == "draw":
+            png = await pipeline.run_draw_shape(params["shape"], params["side1"], params.get("side2"), params.get("side3"))
+            await write_frame(writer, {"id": job_id, "status": "ok"}, png)
+        elif job_type == "sympy":
+            latex = await pipeline.run_symbolic(params["operation"], params["expression"], params.get("point"))
+            await write_frame(writer, {"id": job_id, "status": "ok", "value": latex})
+        elif job_type == "batch":
+            attachments, errors = await pipeline.executor.run_io(pipeline.build_batch_attachments, params["equations"], params["layout"])
+            # The batch is typeset in one LaTeX run, so every image is ready at once;
+            # they go back one frame each to keep frames small, the error list comes last
+            for filename, png in attachments:
+                await write_frame(writer, {"id": job_id, "status": "chunk", "value": filename}, png)
+            await write_frame(writer, {"id": job_id, "status": "ok", "value": errors})
+        else:
+            raise ValueError(f"Unknown job type {job_type!r}.")
+
+    async def handle(self, reader, writer):
+        job_id = None
+        try:
+            header, _ = await read_frame(reader)
+            job_id = header.get("id")
+            job_type = header.get("type")
+            if job_type != "ping":
+                self.pending += 1
+            try:
+                await self.run_job(job_type, header.get("params", {}), writer, job_id)
+                self.completed += job_type != "ping"
+            except Exception as e:
+                self.failed += 1
+                await write_frame(writer, {
+                    "id": job_id,
+                    "status": "error",
+                    "error_type": type(e).__name__,
+                    # args[0] rebuilds the same message when the bot re-raises the type
+                    "message": str(e.args[0]) if len(e.args) == 1 else str(e),
+                })
+            finally:
+                if job_type != "ping":
+                    self.pending -= 1
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            print(f"Lost the connection for job {job_id}: {e}")
+        finally:
+            writer.close()
+
+    async def serve(self):
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            # Left behind by a worker that was killed
+            os.unlink(self.socket_path)
+        pipeline.tex_pool.start()
+        server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        print(f"Render worker {os.getpid()} listening on {self.socket_path}")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        async with server:
+            await stop.wait()
+        # Stop taking jobs before the socket disappears
+        os.unlink(self.socket_path)
+        pipeline.executor.shutdown()
+        pipeline.tex_pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render worker for the LaTeX bot.")
+    parser.add_argument("--socket-dir", default=os.getenv("WORKER_SOCKET_DIR", "bot/tmp/workers"))
+    parser.add_argument("--name", default=socket.gethostname(), help="socket name, unique per replica")
+    args = parser.parse_args()
+    asyncio.run(RenderWorker(os.path.join(args.socket_dir, f"{args.name}-{os.getpid()}.sock")).serve())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+State for interactive messages (quizzes and input tables).
+
+Sessions are small __slots__ records keyed by the ID of the message their
+buttons live on. Buttons only carry a custom_id, which the bot routes back to
+the session in on_interaction, so no View object is kept per message and
+sessions can be saved to disk and picked up again after a restart. Idle
+sessions expire after a TTL and the oldest are dropped past a count or byte
+cap. Large arrays (dataset points) are written once to their own file
+instead of with every save.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class QuizSession:
+    __slots__ = ("questions", "index", "score", "advance_at", "expires_at")
+    kind = "quiz"
+
+    def __init__(self, questions, index=0, score=0, advance_at=0.0, expires_at=0.0):
+        self.questions = tuple(questions)
+        self.index = index
+        self.score = score
+        # When the answered question should be replaced by the next one; 0 while unanswered
+        self.advance_at = advance_at
+        self.expires_at = expires_at
+
+    @property
+    def current_question(self):
+        return self.questions[self.index]
+
+    @property
+    def finished(self):
+        return self.index + 1 >= len(self.questions)
+
+    @property
+    def nbytes(self):
+        # Rough: a question with its options is a few hundred bytes
+        return 512 * len(self.questions)
+
+    def to_dict(self):
+        return {"questions": list(self.questions), "index": self.index, "score": self.score, "advance_at": self.advance_at}
+
+
+class TableSession:
+    __slots__ = ("values", "degree", "expires_at")
+    kind = "table"
+
+    def __init__(self, values, degree=2, expires_at=0.0):
+        # x and y of every row, interleaved; None until entered
+        self.values = list(values)
+        self.degree = degree
+        self.expires_at = expires_at
+
+    @classmethod
+    def empty(cls, rows, degree=2):
+        return cls([None] * (rows * 2), degree)
+
+    @property
+    def rows(self):
+        return len(self.values) // 2
+
+    @property
+    def complete(self):
+        return None not in self.values
+
+    def columns(self):
+        """The entered (x values, y values)."""
+        return self.values[0::2], self.values[1::2]
+
+    @property
+    def nbytes(self):
+        return 64 * len(self.values)
+
+    def to_dict(self):
+        return {"values": self.values, "degree": self.degree}
+
+
+class DatasetSession:
+    """Submitted x/y data behind a plot message, kept as float arrays."""
+    __slots__ = ("x", "y", "degree", "selected", "residuals", "fits", "expires_at")
+    kind = "dataset"
+
+    def __init__(self, x, y, degree=2, selected=None, residuals=False, expires_at=0.0):
+        import numpy as np
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.degree = degree
+        # The fit being shown (None for the best one) and whether as residuals
+        self.selected = selected
+        self.residuals = residuals
+        # Regression results, fitted on first use and not saved
+        self.fits = None
+        self.expires_at = expires_at
+
+    def columns(self):
+        return self.x, self.y
+
+    @property
+    def nbytes(self):
+        return self.x.nbytes + self.y.nbytes
+
+    def to_dict(self):
+        return {"degree": self.degree, "selected": self.selected, "residuals": self.residuals}
+
+    def to_arrays(self):
+        """Arrays saved to their own file; they never change, so they are written only once."""
+        return {"x": self.x, "y": self.y}
+
+
+SESSION_TYPES = {session_type.kind: session_type for session_type in (QuizSession, TableSession, DatasetSession)}
+
+
+class SessionStore:
+    """Bounded, expiring map of message ID -> session, optionally saved to a JSON file."""
+
+    def __init__(self, ttl=3600.0, max_sessions=10000, max_bytes=64 * 1024 * 1024, path="bot/tmp/sessions.json"):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.path = path
+        # Arrays of sessions that have them, one .npz per message
+        self.array_dir = f"{os.path.splitext(path)[0]}_arrays" if path else ""
+        self.expired = 0
+        self.evicted = 0
+        # Approximate memory held by the sessions
+        self.nbytes = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _remove(self, message_id):
+        session = self._sessions.pop(message_id, None)
+        if session is not None:
+            self.nbytes -= session.nbytes
+        return session
+
+    def _evict(self):
+        # Oldest first, but never the session that was just added
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self.nbytes > self.max_bytes):
+            self._remove(next(iter(self._sessions)))
+            self.evicted += 1
+
+    def put(self, message_id: int, session):
+        with self._lock:
+            session.expires_at = time.time() + self.ttl
+            self._remove(message_id)
+            self._sessions[message_id] = session
+            self.nbytes += session.nbytes
+            self._evict()
+            self._dirty = True
+
+    def get(self, message_id: int, kind=None):
+        """The live session for a message, or None. Every access extends its TTL."""
+        with self._lock:
+            session = self._sessions.get(message_id)
+            if session is None or (kind and session.kind != kind):
+                return None
+            if session.expires_at < time.time():
+                self._remove(message_id)
+                self.expired += 1
+                self._dirty = True
+                return None
+            session.expires_at = time.time() + self.ttl
+            self._sessions.move_to_end(message_id)
+            return session
+
+    def touch(self):
+        """Mark the store as changed after a session was modified in place."""
+        self._dirty = True
+
+    def pop(self, message_id: int):
+        with self._lock:
+            self._dirty = True
+            return self._remove(message_id)
+
+    def evict_expired(self):
+        now = time.time()
+        with self._lock:
+            stale = [message_id for message_id, session in self._sessions.items() if session.expires_at < now]
+            for message_id in stale:
+                self._remove(message_id)
+            self.expired += len(stale)
+            self._dirty = self._dirty or bool(stale)
+        return len(stale)
+
+    def save(self):
+        """Write the sessions to disk if anything changed since the last save."""
+        if not self.path or not self._dirty:
+            return False
+        with self._lock:
+            payload = {
+                str(message_id): {"kind": session.kind, "expires_at": session.expires_at, **session.to_dict()}
+                for message_id, session in self._sessions.items()
+            }
+            with_arrays = {str(message_id): session for message_id, session in self._sessions.items() if hasattr(session, "to_arrays")}
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._save_arrays(with_arrays)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        # Readers never see a half-written file
+        os.replace(temp_path, self.path)
+        return True
+
+    def _save_arrays(self, sessions):
+        os.makedirs(self.array_dir, exist_ok=True)
+        for name in os.listdir(self.array_dir):
+            if name.endswith(".npz") and name[:-4] not in sessions:
+                # The session expired or was dropped
+                os.remove(os.path.join(self.array_dir, name))
+        for message_id, session in sessions.items():
+            path = os.path.join(self.array_dir, f"{message_id}.npz")
+            if os.path.exists(path):
+                continue
+            import numpy as np
+            temp_path = f"{path}.tmp.npz"
+            np.savez(temp_path, **session.to_arrays())
+            os.replace(temp_path, path)
+
+    def load(self):
+        """Restore the sessions saved by a previous run, skipping expired ones."""
+        if not self.path:
+            return 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Could not load saved sessions: {e}")
+            return 0
+        now = time.time()
+        with self._lock:
+            for message_id, data in sorted(payload.items(), key=lambda item: item[1]["expires_at"]):
+                session_type = SESSION_TYPES.get(data.pop("kind", None))
+                if session_type is None or data["expires_at"] < now:
+                    continue
+                if hasattr(session_type, "to_arrays"):
+                    import numpy as np
+                    try:
+                        with np.load(os.path.join(self.array_dir, f"{message_id}.npz")) as arrays:
+                            data.update({name: arrays[name] for name in arrays.files})
+                    except (OSError, ValueError):
+                        continue
+                session = self._sessions[int(message_id)] = session_type(**data)
+                self.nbytes += session.nbytes
+            self._evict()
+        return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            kinds = {kind: 0 for kind in SESSION_TYPES}
+            for session in self._sessions.values():
+                kinds[session.kind] += 1
+        return kinds
+
+
+class FollowUps:
+    """Runs coroutine functions after a delay without keeping a coroutine alive while waiting."""
+
+    def __init__(self):
+        self.waiting = 0
+        self._tasks = set()
+
+    def schedule(self, delay, fn, *args):
+        self.waiting += 1
+        asyncio.get_running_loop().call_later(delay, self._start, fn, args)
+
+    def _start(self, fn, args):
+        self.waiting -= 1
+        task = asyncio.get_running_loop().create_task(fn(*args))
+        # The loop only holds weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Follow-up failed: {task.exception()!r}")
@@ -0,0 +1,40 @@
+"""
+Single-flight request coalescing.
+
+While a job for a key is in flight, further callers with the same key wait
+for that job instead of starting their own, and all of them get its result.
+"""
+import asyncio
+
+
+class SingleFlight:
+    """Shares one in-flight coroutine per key among concurrent callers."""
+
+    def __init__(self):
+        self.started = 0
+        self.deduplicated = 0
+        self._inflight = {}
+
+    def _forget(self, key, future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # Mark the exception as retrieved even if every waiter was cancelled
+        if not future.cancelled():
+            future.exception()
+
+    async def do(self, key, make_coroutine):
+        """Await make_coroutine() for key, or join the call already running for it."""
+        future = self._inflight.get(key)
+        if future is None:
+            self.started += 1
+            future = asyncio.ensure_future(make_coroutine())
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.deduplicated += 1
+        # A cancelled caller must not cancel the job the others are waiting on
+        return await asyncio.shield(future)
+
+    @property
+    def in_flight(self):
+        return len(self._inflight)
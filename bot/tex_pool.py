@@ -0,0 +1,155 @@
+"""
+Warm pdflatex worker pool.
+
+The fixed preamble is dumped into a precompiled format file once at startup.
+A few pdflatex processes are then started ahead of time with that format
+already loaded; each one sits waiting on stdin, so a render only pays for
+typesetting its own equation body.
+"""
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from render_io import scratch_root
+
+FORMAT_NAME = "latexbot"
+
+PREAMBLE = r"""\documentclass[12pt,border=4pt]{standalone}
+\usepackage{amsmath}
+\usepackage{amssymb}
+"""
+
+
+class TexWorker:
+    """A pdflatex process that has loaded the format and is waiting for a body."""
+
+    def __init__(self, format_dir, timeout):
+        self.timeout = timeout
+        self.scratch_dir = tempfile.mkdtemp(prefix="texworker-", dir=scratch_root())
+        env = dict(os.environ, TEXFORMATS=f"{format_dir}{os.pathsep}")
+        # The command line "\relax" makes pdflatex load the format straight away;
+        # in scrollmode it then prompts for more input on stdin and blocks there.
+        self.process = subprocess.Popen(
+            ["pdflatex", f"-fmt={FORMAT_NAME}", "-interaction=scrollmode",
+             "-jobname=job", f"-output-directory={self.scratch_dir}", r"\relax"],
+            cwd=self.scratch_dir,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def compile(self, body: str) -> bytes:
+        """Feed the document body to the waiting process and return the PDF bytes."""
+        source = f"\\begin{{document}}\n{body}\n\\end{{document}}\n"
+        try:
+            # Closing stdin right away means any stray terminal read aborts the job
+            self.process.communicate(source.encode("utf-8"), timeout=self.timeout)
+        except subprocess.TimeoutExpired as e:
+            self.process.kill()
+            self.process.wait()
+            raise RuntimeError("LaTeX Error: compilation timed out") from e
+        finally:
+            pdf_path = os.path.join(self.scratch_dir, "job.pdf")
+            pdf = None
+            if os.path.exists(pdf_path):
+                with open(pdf_path, "rb") as f:
+                    pdf = f.read()
+            self.close()
+        if pdf is None:
+            raise RuntimeError("LaTeX Error: no PDF was produced")
+        return pdf
+
+    def close(self):
+        if self.alive():
+            self.process.kill()
+            self.process.wait()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+
+class TexWorkerPool:
+    """Keeps `size` warm TeX workers ready and replaces each one after use."""
+
+    def __init__(self, size=2, format_dir="bot/tmp/format", timeout=30):
+        self.size = size
+        self.format_dir = os.path.abspath(format_dir)
+        self.timeout = timeout
+        self.ready = False
+        self._idle = queue.Queue()
+        self._closed = False
+
+    def start(self):
+        """Dump the preamble format and spawn the initial workers."""
+        if self.size <= 0 or shutil.which("pdflatex") is None:
+            return False
+        try:
+            self._dump_format()
+        except (OSError, subprocess.SubprocessError, RuntimeError) as e:
+            print(f"TeX worker pool disabled: {e}")
+            return False
+        for _ in range(self.size):
+            self._spawn()
+        self.ready = True
+        return True
+
+    def _dump_format(self):
+        os.makedirs(self.format_dir, exist_ok=True)
+        # Other processes sharing format_dir may be loading the format right now, so it is
+        # built in a private directory and moved into place in one step
+        build_dir = tempfile.mkdtemp(prefix="dump-", dir=self.format_dir)
+        try:
+            with open(os.path.join(build_dir, "preamble.tex"), "w", encoding="utf-8") as f:
+                f.write(PREAMBLE)
+                f.write("\\dump\n")
+            start = time.perf_counter()
+            subprocess.run(
+                ["pdflatex", "-ini", "-interaction=nonstopmode", f"-jobname={FORMAT_NAME}",
+                 "&pdflatex", "preamble.tex"],
+                cwd=build_dir,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=120,
+                check=False,
+            )
+            built = os.path.join(build_dir, f"{FORMAT_NAME}.fmt")
+            if not os.path.exists(built):
+                raise RuntimeError("pdflatex did not write a format file")
+            os.replace(built, os.path.join(self.format_dir, f"{FORMAT_NAME}.fmt"))
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+        print(f"Dumped LaTeX format in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def _spawn(self):
+        if not self._closed:
+            self._idle.put(TexWorker(self.format_dir, self.timeout))
+
+    def compile(self, body: str) -> bytes:
+        """Typeset a document body on a warm worker and return the PDF bytes."""
+        try:
+            worker = self._idle.get_nowait()
+        except queue.Empty:
+            # Every warm worker is busy, so pay for a cold start rather than wait
+            worker = TexWorker(self.format_dir, self.timeout)
+        else:
+            # Refill the pool in the background while this job runs
+            threading.Thread(target=self._spawn, daemon=True).start()
+        if not worker.alive():
+            worker.close()
+            worker = TexWorker(self.format_dir, self.timeout)
+        return worker.compile(body)
+
+    def close(self):
+        self._closed = True
+        self.ready = False
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
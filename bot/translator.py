@@ -0,0 +1,115 @@
+"""
+AI translation of plain-text math into LaTeX.
+
+Answers are cached (TTL + LRU) on the normalized input, identical requests
+that arrive while one is in flight share a single model call, and calls are
+limited in concurrency and time. The model sits behind a small backend
+interface so a local stub can stand in for Gemini.
+"""
+import asyncio
+import time
+
+from cachetools import TTLCache
+
+from singleflight import SingleFlight
+
+
+class GeminiBackend:
+    """Asks a google.generativeai model, using its async client."""
+
+    def __init__(self, model_name, prompt, api_key=None):
+        self.model_name = model_name
+        self.prompt = prompt
+        self.api_key = api_key
+        self._model = None
+
+    @property
+    def model(self):
+        # google.generativeai takes over half a second to import, so it waits for the first use
+        if self._model is None:
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def warm(self):
+        """Import the client and build the model ahead of the first request."""
+        return self.model
+
+    async def generate(self, text: str) -> str:
+        response = await self.model.generate_content_async(f"{self.prompt} {text}")
+        return response.text
+
+
+class StubBackend:
+    """Local stand-in for the model: returns canned answers, or the input unchanged."""
+
+    def __init__(self, responses=None, delay=0.0):
+        self.responses = responses or {}
+        self.delay = delay
+        self.calls = 0
+
+    async def generate(self, text: str) -> str:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.responses.get(text, text)
+
+
+def normalize_prompt(text: str) -> str:
+    """Collapse whitespace so repeated phrasings share a cache entry."""
+    return " ".join(text.split())
+
+
+class Translator:
+    """Cached, coalesced and rate-limited access to a translation backend."""
+
+    def __init__(self, backend, max_entries=1024, ttl=24 * 60 * 60, max_concurrency=4, timeout=20.0, metrics=None):
+        self.backend = backend
+        self.metrics = metrics
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.hits = 0
+        self.misses = 0
+        self._cache = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._flight = SingleFlight()
+        self._semaphore = None
+
+    async def translate(self, text: str) -> str:
+        """Return the model's answer for text, calling the model at most once per input."""
+        key = normalize_prompt(text)
+        if key in self._cache:
+            self.hits += 1
+            return self._cache[key]
+        self.misses += 1
+        return await self._flight.do(key, lambda: self._call(key))
+
+    async def _call(self, key):
+        if self._semaphore is None:
+            # Created lazily so it belongs to the running event loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(self.backend.generate(key), self.timeout)
+            except asyncio.TimeoutError as e:
+                raise RuntimeError("The AI took too long to respond.") from e
+            finally:
+                if self.metrics is not None:
+                    self.metrics.observe("stage_seconds", time.perf_counter() - start, "ai")
+        self._cache[key] = result
+        return result
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'model_calls': self._flight.started,
+            'coalesced': self._flight.deduplicated,
+            'cached': len(self._cache),
+        }
+
+    def clear(self):
+        self._cache.clear()